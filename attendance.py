@@ -0,0 +1,108 @@
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id TEXT NOT NULL,
+    guild_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, event_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_events_start ON events (guild_id, start_ts);
+
+CREATE TABLE IF NOT EXISTS attendance (
+    guild_id INTEGER NOT NULL,
+    event_id TEXT NOT NULL,
+    member_id INTEGER NOT NULL,
+    member_name TEXT NOT NULL,
+    checked_at INTEGER NOT NULL,
+    present INTEGER NOT NULL,
+    seconds INTEGER,
+    PRIMARY KEY (guild_id, event_id, member_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_attendance_member ON attendance (guild_id, member_id, checked_at);
+"""
+
+
+def _ts(dt):
+    return int(dt.timestamp())
+
+
+class AttendanceStore:
+    """Check-in history in SQLite, keyed by guild, event, member and time.
+
+    Queries run on indexes and aggregate inside SQLite, so nothing is loaded
+    wholesale into memory. Methods are blocking; call them through
+    ``asyncio.to_thread``. A lock serializes use of the shared connection.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def record_checkin(self, guild_id, event_id, title, start, end, members, present):
+        """``members`` is ``{member_id: name}``; ``present`` the ids that were in voice."""
+        now = _ts(datetime.now(timezone.utc))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                (event_id, guild_id, title, _ts(start), _ts(end)))
+            self._conn.executemany(
+                "INSERT INTO attendance (guild_id, event_id, member_id, member_name, checked_at, present) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild_id, event_id, member_id) DO UPDATE SET "
+                "member_name = excluded.member_name, present = excluded.present, checked_at = excluded.checked_at",
+                [(guild_id, event_id, member_id, name, now, int(member_id in present))
+                 for member_id, name in members.items()])
+
+    def record_durations(self, guild_id, event_id, durations):
+        """Store seconds spent in voice; someone who showed up late counts as present."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE attendance SET seconds = ?, present = MAX(present, ? > 0) "
+                "WHERE guild_id = ? AND event_id = ? AND member_id = ?",
+                [(int(seconds), int(seconds), guild_id, event_id, member_id)
+                 for member_id, seconds in durations.items()])
+            self._conn.execute(
+                "UPDATE attendance SET seconds = 0 WHERE guild_id = ? AND event_id = ? AND seconds IS NULL",
+                (guild_id, event_id))
+
+    def attendance_rates(self, guild_id, since):
+        """``(member_name, attended, total)`` per member for events starting after ``since``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT a.member_name, SUM(a.present), COUNT(*) FROM events e "
+                "JOIN attendance a ON a.guild_id = e.guild_id AND a.event_id = e.event_id "
+                "WHERE e.guild_id = ? AND e.start_ts >= ? "
+                "GROUP BY a.member_id ORDER BY SUM(a.present) * 1.0 / COUNT(*), a.member_name",
+                (guild_id, _ts(since))).fetchall()
+
+    def missed_last(self, guild_id, count, title_filter=None):
+        """Members absent from every one of the last ``count`` events (optionally matching a title)."""
+        with self._lock:
+            # % และ _ ในชื่อที่ผู้ใช้พิมพ์ต้องเป็นตัวอักษรธรรมดา ไม่ใช่ wildcard
+            pattern = re.sub(r"([\\%_])", r"\\\1", title_filter or "")
+            last = self._conn.execute(
+                "SELECT event_id FROM events WHERE guild_id = ? AND title LIKE ? ESCAPE '\\' "
+                "ORDER BY start_ts DESC LIMIT ?",
+                (guild_id, f"%{pattern}%", count)).fetchall()
+            if not last:
+                return [], 0
+            ids = [row[0] for row in last]
+            marks = ",".join("?" * len(ids))
+            rows = self._conn.execute(
+                f"SELECT member_name FROM attendance WHERE guild_id = ? AND event_id IN ({marks}) "
+                f"GROUP BY member_id HAVING SUM(present) = 0 AND COUNT(*) = ? ORDER BY member_name",
+                (guild_id, *ids, len(ids))).fetchall()
+            return [row[0] for row in rows], len(ids)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
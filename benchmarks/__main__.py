@@ -0,0 +1,278 @@
+"""Offline benchmarks for the sync, reminder, schedule and check-in pipeline.
+
+    python -m benchmarks                         # default sizes
+    python -m benchmarks --events 10,10000 --channels 1,500 --latency 0.05
+    python -m benchmarks --json after.json --compare before.json
+
+Google Calendar and Discord are replaced by the fakes in benchmarks/fakes.py
+and time by a simulated clock, so runs need no network or tokens and are
+repeatable. Results go to stdout and bench_output.txt.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fakes import FakeCalendar, SimClock
+from benchmarks.generators import make_events, make_guilds, mutate
+from calendar_feed import CalendarFeed
+from dispatcher import Dispatcher
+from instrumentation import log
+from presence import PresenceTracker, checkin_messages
+from rendering import DEFAULT_TZ
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+async def _noop_fire(feed, event, kind, fire_at):
+    return None
+
+
+async def _synced_feed(count, recurring=0.1, fire=_noop_fire, clock=None):
+    now = clock.now() if clock else datetime.now(timezone.utc)
+    calendar = FakeCalendar(make_events(count, start=now - timedelta(days=10), recurring=recurring))
+    feed = CalendarFeed(calendar, "bench", fire, clock=clock)
+    await feed.store.sync()
+    return calendar, feed
+
+
+async def _peak_memory(coro_fn, *args):
+    # tracemalloc ทำให้ช้าลงหลายเท่า จึงวัดหน่วยความจำแยกรอบจากการจับเวลา
+    tracemalloc.start()
+    try:
+        await coro_fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def bench_sync(count, ticks=20):
+    """Full sync once, then ``ticks`` incremental syncs with 1% of events changed each."""
+    started = time.perf_counter()
+    calendar, feed = await _synced_feed(count)
+    full = time.perf_counter() - started
+
+    latencies = []
+    for tick in range(ticks):
+        calendar.change(mutate(list(calendar.items.values()), seed=tick))
+        started = time.perf_counter()
+        await feed.store.sync()
+        latencies.append(time.perf_counter() - started)
+    return {
+        "scenario": "sync", "size": count,
+        "full_ms": full * 1000,
+        "events_per_s": count / full if full else 0.0,
+        "occurrences": len(feed.store.events),
+        "tick_p50_ms": _percentile(latencies, 50) * 1000,
+        "tick_p99_ms": _percentile(latencies, 99) * 1000,
+        "peak_mb": await _peak_memory(_synced_feed, count) / 2**20,
+    }
+
+
+class _LagRecorder:
+    """Fire callback that records how late each reminder went out.
+
+    Reminders already overdue when the run starts ("today" of an event later
+    today) are catch-up, not lag, and are only counted.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.started_at = clock.now()
+        self.lags, self.fired, self.catch_up = [], 0, 0
+
+    def record(self, fire_at):
+        self.fired += 1
+        if fire_at < self.started_at:
+            self.catch_up += 1
+        else:
+            self.lags.append((self.clock.now() - fire_at).total_seconds())
+
+    async def __call__(self, feed, event, kind, fire_at):
+        self.record(fire_at)
+
+
+def _timed(evaluate, pop_due):
+    def wrapper(now):
+        started = time.perf_counter()
+        try:
+            return pop_due(now)
+        finally:
+            evaluate.append(time.perf_counter() - started)
+    return wrapper
+
+
+async def _drive_heap(scheduler, clock, until):
+    """Let ReminderScheduler.run() itself wait for each deadline on the simulated clock."""
+    task = asyncio.create_task(scheduler.run())
+    try:
+        while clock.now() < until:
+            deadline = scheduler.next_deadline()
+            if deadline is None or deadline > until:
+                break
+            await asyncio.sleep(0)
+        # ให้ task ที่ยิงแจ้งเตือนรอบสุดท้ายได้ทำงาน
+        await asyncio.sleep(0)
+    finally:
+        task.cancel()
+
+
+def _drive_poll(scheduler, clock, until, step, recorder):
+    """What a fixed ``step`` polling loop would do with the same reminders."""
+    while clock.now() < until:
+        clock.advance(step)
+        for _, _, fire_at in scheduler.pop_due(clock.now()):
+            recorder.record(fire_at)
+
+
+async def bench_reminders(count, hours=48, poll=30):
+    """Reminder lag over ``hours`` of simulated time: the heap scheduler's own loop vs a ``poll``-second loop."""
+    rows = []
+    for mode in ("heap", f"poll{poll}s"):
+        clock = SimClock()
+        recorder = _LagRecorder(clock)
+        _, feed = await _synced_feed(count, fire=recorder, clock=clock)
+        evaluate = []
+        feed.reminders.pop_due = _timed(evaluate, feed.reminders.pop_due)
+        until = clock.now() + timedelta(hours=hours)
+        if mode == "heap":
+            await _drive_heap(feed.reminders, clock, until)
+        else:
+            _drive_poll(feed.reminders, clock, until, timedelta(seconds=poll), recorder)
+        lags, fired, catch_up = recorder.lags, recorder.fired, recorder.catch_up
+        rows.append({
+            "scenario": f"reminders-{mode}", "size": count,
+            "fired": fired, "catch_up": catch_up, "evaluations": len(evaluate),
+            "lag_p50_ms": _percentile(lags, 50) * 1000, "lag_p99_ms": _percentile(lags, 99) * 1000,
+            "lag_max_ms": max(lags, default=0.0) * 1000,
+            "eval_p50_ms": _percentile(evaluate, 50) * 1000,
+            "eval_p99_ms": _percentile(evaluate, 99) * 1000,
+        })
+    return rows
+
+
+async def bench_month(count, months=3):
+    """The monthly schedule through CalendarFeed.month_text: cold render vs cache hit."""
+    _, feed = await _synced_feed(count)
+    now = datetime.now(timezone.utc)
+    cold, warm = [], []
+    for offset in range(months):
+        year, month = now.year + (now.month + offset - 1) // 12, (now.month + offset - 1) % 12 + 1
+        feed.month_views.clear()
+        started = time.perf_counter()
+        await feed.month_text(year, month, DEFAULT_TZ)
+        cold.append(time.perf_counter() - started)
+        for _ in range(20):
+            started = time.perf_counter()
+            await feed.month_text(year, month, DEFAULT_TZ)
+            warm.append(time.perf_counter() - started)
+    return {
+        "scenario": "month", "size": count,
+        "cold_p50_ms": _percentile(cold, 50) * 1000, "cold_max_ms": max(cold) * 1000,
+        "warm_p50_ms": _percentile(warm, 50) * 1000,
+    }
+
+
+async def bench_checkin(channels, members=30, latency=0.0):
+    """Check-in fan-out: the presence roll call and the real check-in post, once per channel."""
+    guilds = make_guilds(channels, members=members, latency=latency)
+    roles = {guild.id: guild.role_id for guild in guilds}
+    presence = PresenceTracker(roles.get)
+    for guild in guilds:
+        presence.seed(guild)
+    dispatcher = Dispatcher(max_concurrency=10)
+    targets = [channel for guild in guilds for channel in guild.text_channels]
+
+    async def checkin(channel):
+        guild = channel.guild
+        role_members, present = presence.roll_call(guild.id, guild.voice_channel_id)
+        return [await channel.send(chunk) for chunk in checkin_messages("Bench", "01/01/2026", role_members, present)]
+
+    report = await dispatcher.fan_out(targets, checkin)
+    latencies = list(report.latencies.values())
+    return {
+        "scenario": "checkin", "size": channels,
+        "elapsed_ms": report.elapsed * 1000,
+        "channels_per_s": len(targets) / report.elapsed if report.elapsed else 0.0,
+        "send_p50_ms": _percentile(latencies, 50) * 1000,
+        "send_p99_ms": _percentile(latencies, 99) * 1000,
+        "failed": len(report.failures),
+    }
+
+
+def _format(row):
+    fields = " ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                      for key, value in row.items() if key not in ("scenario", "size"))
+    return f"{row['scenario']:<18} size={row['size']:<6} {fields}"
+
+
+def compare(rows, baseline, tolerance):
+    """Timing metrics (``*_ms``) that got slower than ``baseline`` by more than ``tolerance``."""
+    previous = {(row["scenario"], row["size"]): row for row in baseline}
+    regressions = []
+    for row in rows:
+        before = previous.get((row["scenario"], row["size"]))
+        if before is None:
+            continue
+        for key, value in row.items():
+            # ต่ำกว่า 1ms ถือเป็น noise ของเครื่อง
+            if key.endswith("_ms") and key in before and value > before[key] * (1 + tolerance) and value - before[key] > 1:
+                regressions.append(f"{row['scenario']} size={row['size']} {key}: {before[key]:.2f} → {value:.2f}")
+    return regressions
+
+
+async def run(args):
+    rows = []
+    for count in args.events:
+        rows.append(await bench_sync(count))
+        rows.extend(await bench_reminders(count))
+        rows.append(await bench_month(count))
+    for channels in args.channels:
+        rows.append(await bench_checkin(channels, latency=args.latency))
+    return rows
+
+
+def _sizes(text):
+    return [int(part) for part in text.split(",") if part]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=_sizes, default=_sizes("10,1000,10000"))
+    parser.add_argument("--channels", type=_sizes, default=_sizes("1,50,500"))
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Discord round trip in seconds")
+    parser.add_argument("--output", default="bench_output.txt")
+    parser.add_argument("--json", help="also write the raw results here")
+    parser.add_argument("--compare", help="results JSON of an earlier run; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    log.setLevel(logging.ERROR)
+    rows = asyncio.run(run(args))
+    lines = [_format(row) for row in rows]
+    print("\n".join(lines))
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import asyncio
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+
+class SimClock:
+    """Simulated wall clock with the interface of reminders.WallClock.
+
+    Waiting jumps straight past the timeout instead of sleeping, but time
+    actually spent computing still passes, so a lag measured against it is
+    the scheduler's own overhead rather than zero by construction.
+    """
+
+    def __init__(self, start=None):
+        self._start = start or datetime.now(timezone.utc)
+        self._skipped = timedelta(0)
+        self._real = time.perf_counter()
+
+    def now(self):
+        return self._start + self._skipped + timedelta(seconds=time.perf_counter() - self._real)
+
+    def advance(self, delta):
+        self._skipped += delta
+        return self.now()
+
+    async def wait(self, event, timeout):
+        # ให้ task ที่รออยู่ (เช่นการยิงแจ้งเตือน) ทำงานก่อนเวลาจะกระโดด เหมือนตอนรอจริง
+        await asyncio.sleep(0)
+        if event.is_set():
+            return
+        if timeout is None:
+            await event.wait()
+            return
+        self.advance(timedelta(seconds=timeout))
+
+
+class _Request:
+    def __init__(self, method, respond):
+        self.methodId = method
+        self._respond = respond
+
+
+class _Events:
+    def __init__(self, calendar):
+        self._calendar = calendar
+
+    def list(self, **params):
+        self._calendar.list_calls += 1
+        return _Request("calendar.events.list", lambda: self._calendar.respond(params))
+
+
+class FakeCalendar:
+    """Stands in for AsyncCalendarClient + the Calendar API for one calendar.
+
+    Full listings are paged like the real API. ``change()`` queues items that
+    the next ``syncToken`` request returns, the way incremental sync does.
+    ``latency`` is awaited per request to model the network.
+    """
+
+    def __init__(self, events, latency=0.0, page_size=2500, time_zone="Asia/Bangkok"):
+        self.items = {event['id']: event for event in events}
+        self.latency = latency
+        self.page_size = page_size
+        self.time_zone = time_zone
+        self.list_calls = 0
+        self._pending = []
+        self._tokens = itertools.count(1)
+
+    def events(self):
+        return _Events(self)
+
+    async def execute(self, request, timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return request._respond()
+
+    def change(self, items):
+        for item in items:
+            if item.get('status') == 'cancelled':
+                self.items.pop(item['id'], None)
+            else:
+                self.items[item['id']] = item
+        self._pending.extend(items)
+
+    def respond(self, params):
+        page = {'timeZone': self.time_zone}
+        if params.get('syncToken'):
+            page['items'], self._pending = self._pending, []
+            page['nextSyncToken'] = f"t{next(self._tokens)}"
+            return page
+        items = list(self.items.values())
+        offset = int(params.get('pageToken') or 0)
+        size = params.get('maxResults') or self.page_size
+        page['items'] = items[offset:offset + size]
+        if offset + size < len(items):
+            page['nextPageToken'] = str(offset + size)
+        else:
+            page['nextSyncToken'] = f"t{next(self._tokens)}"
+        return page
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel, content):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.content = content
+
+    async def delete(self):
+        self.channel.deleted += 1
+
+
+class FakeChannel:
+    """A text channel that records what was sent; ``latency`` models the HTTP round trip."""
+
+    def __init__(self, channel_id, guild, latency=0.0):
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+        self.guild = guild
+        self.latency = latency
+        self.sent = []
+        self.deleted = 0
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = FakeMessage(self, content)
+        self.sent.append(message)
+        return message
+
+
+class FakeGuild:
+    """Just enough of discord.Guild for PresenceTracker.seed and check-in."""
+
+    def __init__(self, guild_id, role_id, members, voice_channel_id):
+        self.id = guild_id
+        self.role_id = role_id
+        self.voice_channel_id = voice_channel_id
+        role = SimpleNamespace(id=role_id, members=members)
+        self._roles = {role_id: role}
+        self.voice_channels = [SimpleNamespace(id=voice_channel_id, members=[])]
+        self.stage_channels = []
+        self.text_channels = []
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        if channel_id == self.voice_channel_id:
+            return self.voice_channels[0]
+        return next((c for c in self.text_channels if c.id == channel_id), None)
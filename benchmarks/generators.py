@@ -0,0 +1,68 @@
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from benchmarks.fakes import FakeChannel, FakeGuild
+
+TITLES = ["ซ้อมทีม", "Scrim", "แข่งลีก", "Review VOD", "ประชุม", "Tryout", "Practice", "Bootcamp"]
+
+
+def make_events(count, start=None, days=60, recurring=0.0, all_day=0.05, jitter=timedelta(minutes=1), seed=1):
+    """``count`` events spread over ``days`` from ``start``.
+
+    ``recurring`` is the share of weekly series (each counts as one item,
+    the way the API returns masters); ``all_day`` the share of all-day events.
+    Start times sit on a 15-minute grid plus up to ``jitter``, so reminder
+    deadlines do not all fall on whole minutes.
+    """
+    rng = random.Random(seed)
+    start = (start or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    events = []
+    for n in range(count):
+        title = f"{rng.choice(TITLES)} #{n}"
+        begin = start + timedelta(minutes=rng.randrange(days * 24 * 60 // 15) * 15,
+                                  seconds=rng.uniform(0, jitter.total_seconds()))
+        event = {'id': f"ev{n}", 'etag': '"1"', 'status': 'confirmed', 'summary': title}
+        if rng.random() < all_day:
+            day = begin.date()
+            event['start'] = {'date': day.isoformat()}
+            event['end'] = {'date': (day + timedelta(days=1)).isoformat()}
+        else:
+            event['start'] = {'dateTime': begin.isoformat(), 'timeZone': 'Asia/Bangkok'}
+            event['end'] = {'dateTime': (begin + timedelta(hours=rng.choice((1, 2, 3)))).isoformat(),
+                            'timeZone': 'Asia/Bangkok'}
+            if rng.random() < recurring:
+                event['recurrence'] = [f"RRULE:FREQ=WEEKLY;COUNT={rng.randrange(4, 20)}"]
+        events.append(event)
+    return events
+
+
+def mutate(events, share=0.01, seed=2):
+    """Changed copies of ``share`` of the events, as an incremental sync would return them."""
+    rng = random.Random(seed)
+    changed = []
+    for event in rng.sample(events, max(1, int(len(events) * share))):
+        if rng.random() < 0.2:
+            changed.append({'id': event['id'], 'status': 'cancelled'})
+            continue
+        copy = {k: v for k, v in event.items() if not k.startswith('_')}
+        etag = int(copy['etag'].strip('"')) + 1
+        copy['etag'] = f'"{etag}"'
+        copy['summary'] = f"{copy['summary']} (เลื่อน)"
+        changed.append(copy)
+    return changed
+
+
+def make_guilds(guilds, channels_per_guild=1, members=30, in_voice=0.6, latency=0.0, seed=3):
+    """Guilds with a role of ``members`` members, ``in_voice`` of them sitting in the voice channel."""
+    rng = random.Random(seed)
+    ids = itertools.count(1000)
+    result = []
+    for g in range(guilds):
+        people = [SimpleNamespace(id=next(ids), display_name=f"member{g}-{m}") for m in range(members)]
+        guild = FakeGuild(next(ids), next(ids), people, next(ids))
+        guild.voice_channels[0].members = [p for p in people if rng.random() < in_voice]
+        guild.text_channels = [FakeChannel(next(ids), guild, latency) for _ in range(channels_per_guild)]
+        result.append(guild)
+    return result
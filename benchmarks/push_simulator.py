@@ -0,0 +1,62 @@
+"""Post simulated Calendar push notifications to a running bot.
+
+    python -m benchmarks.push_simulator                       # one "exists" per watched calendar
+    python -m benchmarks.push_simulator --count 20 --interval 0.1 --calendar <id>
+
+Channel ids come from the bot's watch_channels.json; the token must match
+CALENDAR_WEBHOOK_TOKEN. Each request is what Google sends: an empty POST
+whose X-Goog-* headers identify the channel and what happened.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+
+
+async def post(session, url, token, calendar_id, channel, number, state="exists"):
+    headers = {
+        "X-Goog-Channel-ID": channel["id"],
+        "X-Goog-Channel-Token": token,
+        "X-Goog-Resource-ID": channel["resource_id"],
+        "X-Goog-Resource-State": state,
+        "X-Goog-Resource-URI": f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events",
+        "X-Goog-Message-Number": str(number),
+    }
+    started = time.perf_counter()
+    async with session.post(url, headers=headers) as response:
+        return response.status, time.perf_counter() - started
+
+
+async def run(args):
+    with open(args.state, encoding="utf-8") as f:
+        channels = json.load(f)
+    if args.calendar:
+        channels = {args.calendar: channels[args.calendar]}
+    async with aiohttp.ClientSession() as session:
+        for number in range(1, args.count + 1):
+            for calendar_id, channel in channels.items():
+                status, elapsed = await post(session, args.url, args.token, calendar_id, channel, number, args.state_header)
+                print(f"{calendar_id} #{number} → {status} in {elapsed * 1000:.1f}ms")
+            await asyncio.sleep(args.interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.push_simulator", description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=os.getenv("CALENDAR_WEBHOOK_URL", "http://localhost:8080/calendar/notify"))
+    parser.add_argument("--token", default=os.getenv("CALENDAR_WEBHOOK_TOKEN", ""))
+    parser.add_argument("--state", default="watch_channels.json")
+    parser.add_argument("--calendar", help="only this calendar id")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--state-header", dest="state_header", default="exists", help="X-Goog-Resource-State to send")
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
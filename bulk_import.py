@@ -0,0 +1,199 @@
+import csv
+import io
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from calendar_sync import TH_TZ, EVENT_FIELDS
+
+# Google แนะนำไม่เกิน 50 คำสั่งต่อ batch สำหรับ Calendar API
+BATCH_SIZE = 50
+EVENT_DURATION = timedelta(hours=1)
+
+LINE_RE = re.compile(
+    r"^(?:(add|del|edit)\s+)?(.+?)\s+(\d{2}/\d{2}/\d{4})\s+(\d{2}:\d{2})"
+    r"(?:\s+(\d{2}/\d{2}/\d{4}))?(?:\s+(\d{2}:\d{2}))?\s*$",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class ImportRow:
+    line_no: int
+    action: str
+    title: str
+    start: datetime = None
+    new_start: datetime = None
+    all_day: bool = False
+    event: dict = None
+    error: str = None
+    result: dict = None
+    # เขตเวลาของกิลด์ที่สั่งนำเข้า ใช้อ่านและแสดงวันเวลาของแถวนี้
+    tz: object = TH_TZ
+
+    def label(self):
+        if self.start is None:
+            return f"{self.line_no}. `{self.title}`"
+        if self.all_day:
+            return f"{self.line_no}. {self.action} `{self.title}` {self.start.strftime('%d/%m/%Y')}"
+        when = self.start.astimezone(self.tz).strftime('%d/%m/%Y %H:%M')
+        return f"{self.line_no}. {self.action} `{self.title}` {when}"
+
+
+def _local_datetime(date_str, time_str, tz):
+    try:
+        date_part = datetime.strptime(date_str or "", "%d/%m/%Y").date()
+        time_part = datetime.strptime(time_str or "", "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"วันหรือเวลาไม่ถูกต้อง: {date_str} {time_str}")
+    return datetime.combine(date_part, time_part).replace(tzinfo=tz)
+
+
+def _make_row(tz, line_no, action, title, date_str, time_str, new_date_str=None, new_time_str=None):
+    action = (action or "add").lower()
+    row = ImportRow(line_no, action, (title or "").strip(), tz=tz)
+    try:
+        if action not in ("add", "del", "edit"):
+            raise ValueError(f"ไม่รู้จักคำสั่ง `{action}`")
+        if not row.title:
+            raise ValueError("ไม่มีชื่อกิจกรรม")
+        row.start = _local_datetime(date_str, time_str, tz)
+        if action == "edit":
+            if not new_date_str and not new_time_str:
+                raise ValueError("ไม่ได้ระบุวันหรือเวลาใหม่")
+            row.new_start = _local_datetime(
+                new_date_str or row.start.strftime("%d/%m/%Y"),
+                new_time_str or row.start.strftime("%H:%M"), tz)
+    except ValueError as e:
+        row.error = str(e)
+    return row
+
+
+def parse_lines(text, tz=TH_TZ):
+    """``[add|del|edit] title dd/mm/yyyy HH:MM [new dd/mm/yyyy] [new HH:MM]`` per line, in ``tz``."""
+    rows = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        match = LINE_RE.match(line.strip())
+        if not match:
+            rows.append(ImportRow(line_no, "?", line.strip(), error="รูปแบบไม่ถูกต้อง", tz=tz))
+            continue
+        rows.append(_make_row(tz, line_no, *match.groups()))
+    return rows
+
+
+def parse_csv(text, tz=TH_TZ):
+    """CSV with header ``action,title,date,time,new_date,new_time`` (action defaults to add), in ``tz``."""
+    rows = []
+    reader = csv.DictReader(io.StringIO(text))
+    for line_no, record in enumerate(reader, 2):
+        # แถวที่มีคอลัมน์เกินหัวตาราง DictReader เก็บส่วนเกินเป็น list ไว้ใต้ key None
+        if record.pop(None, None):
+            rows.append(ImportRow(line_no, "?", ",".join(v or "" for v in record.values()),
+                                  error="จำนวนคอลัมน์เกินหัวตาราง", tz=tz))
+            continue
+        record = {(k or "").strip().lower(): (v or "").strip() for k, v in record.items()}
+        rows.append(_make_row(
+            tz, line_no, record.get("action") or "add", record.get("title"),
+            record.get("date"), record.get("time"),
+            record.get("new_date") or None, record.get("new_time") or None))
+    return rows
+
+
+def _ics_datetime(value, params, tz, date_tz):
+    if params.get("VALUE") == "DATE" or re.fullmatch(r"\d{8}", value):
+        return datetime.strptime(value, "%Y%m%d").replace(tzinfo=date_tz), True
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc), False
+    # ไม่มี Z และไม่รองรับ TZID อื่น ถือว่าเป็นเวลาของกิลด์
+    return datetime.strptime(value, "%Y%m%dT%H%M%S").replace(tzinfo=tz), False
+
+
+def parse_ics(text, tz=TH_TZ, date_tz=None):
+    """Every VEVENT becomes an ``add`` row (SUMMARY + DTSTART).
+
+    Floating times are read in ``tz``; all-day dates in ``date_tz`` (the
+    calendar's own zone), defaulting to ``tz``.
+    """
+    date_tz = date_tz or tz
+    # บรรทัดที่ขึ้นต้นด้วยช่องว่างคือบรรทัดต่อจากบรรทัดก่อนหน้า (RFC 5545 folding)
+    unfolded = re.sub(r"\r?\n[ \t]", "", text)
+    rows = []
+    current = None
+    for line_no, line in enumerate(unfolded.splitlines(), 1):
+        if line == "BEGIN:VEVENT":
+            current = ImportRow(line_no, "add", "", tz=tz)
+        elif line == "END:VEVENT" and current is not None:
+            if not current.title:
+                current.error = current.error or "ไม่มี SUMMARY"
+            if current.start is None:
+                current.error = current.error or "ไม่มี DTSTART"
+                current.start = datetime.now(tz)
+            rows.append(current)
+            current = None
+        elif current is not None and ":" in line:
+            name, value = line.split(":", 1)
+            name, *raw_params = name.split(";")
+            params = dict(p.split("=", 1) for p in raw_params if "=" in p)
+            if name == "SUMMARY":
+                current.title = value.replace("\\,", ",").replace("\\;", ";").strip()
+            elif name == "DTSTART":
+                try:
+                    current.start, current.all_day = _ics_datetime(value, params, tz, date_tz)
+                except ValueError:
+                    current.error = f"DTSTART ไม่ถูกต้อง: {value}"
+    return rows
+
+
+def event_body(row, start):
+    if row.all_day:
+        # start ของแถวทั้งวันอยู่ในเขตเวลาที่อ่านมาแล้ว ใช้วันที่ตามนั้นเลย
+        day = start.date()
+        return {'summary': row.title,
+                'start': {'date': day.isoformat()},
+                'end': {'date': (day + timedelta(days=1)).isoformat()}}
+    start_utc = start.astimezone(timezone.utc)
+    return {'summary': row.title,
+            'start': {'dateTime': start_utc.isoformat(), 'timeZone': 'UTC'},
+            'end': {'dateTime': (start_utc + EVENT_DURATION).isoformat(), 'timeZone': 'UTC'}}
+
+
+def build_request(service, calendar_id, row):
+    events = service.events()
+    if row.action == "add":
+        return events.insert(calendarId=calendar_id, body=event_body(row, row.start), fields=EVENT_FIELDS)
+    if row.action == "del":
+        return events.delete(calendarId=calendar_id, eventId=row.event['id'])
+    changes = event_body(row, row.new_start)
+    del changes['summary']
+    return events.patch(calendarId=calendar_id, eventId=row.event['id'], body=changes, fields=EVENT_FIELDS)
+
+
+async def submit(client, calendar_id, rows):
+    """Send the rows through the batch endpoint in chunks; fills ``row.result``/``row.error``."""
+    for i in range(0, len(rows), BATCH_SIZE):
+        chunk = rows[i:i + BATCH_SIZE]
+        responses = {}
+
+        # callback ถูกเรียกใน thread ของ executor เก็บผลไว้ก่อนแล้วค่อยใช้บน event loop
+        def collect(request_id, response, exception):
+            responses[request_id] = (response, exception)
+
+        batch = client.service.new_batch_http_request(callback=collect)
+        for n, row in enumerate(chunk):
+            batch.add(build_request(client.service, calendar_id, row), request_id=str(n))
+        try:
+            await client.execute(batch, timeout=client.timeout * 3)
+        except Exception as e:
+            for row in chunk:
+                row.error = f"batch ล้มเหลว: {e}"
+            continue
+
+        for n, row in enumerate(chunk):
+            response, exception = responses.get(str(n), (None, "ไม่ได้รับผลลัพธ์"))
+            if exception is not None:
+                row.error = str(exception)
+            else:
+                row.result = response
+    return rows
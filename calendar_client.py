@@ -0,0 +1,227 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import google_auth_httplib2
+import httplib2
+from googleapiclient.errors import HttpError
+
+from instrumentation import log
+from metrics import calendar_api_calls, calendar_circuit_open
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# เรียกซ้ำได้โดยไม่เกิดกิจกรรมซ้ำ ส่วน insert/batch ลองใหม่เฉพาะตอนโดน rate limit (คำขอยังไม่ถูกทำ)
+IDEMPOTENT_METHODS = {
+    "calendar.events.list", "calendar.events.get", "calendar.events.patch",
+    "calendar.events.update", "calendar.events.delete", "calendar.channels.stop",
+}
+# ต่ออายุ token ก่อนหมดจริง จะได้ไม่มี request ไหนต้องรอ refresh ตอน 401
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class CircuitOpenError(Exception):
+    """The Calendar API failed repeatedly; calls are refused until the breaker resets."""
+
+
+def _rate_limited(error):
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    # Calendar ตอบ rate limit เป็น 403 + reason rateLimitExceeded / userRateLimitExceeded
+    return error.resp.status == 403 and b"ratelimitexceeded" in (error.content or b"").lower()
+
+
+def _transient(error):
+    """Worth retrying: rate limits, 5xx, timeouts and dropped connections."""
+    if isinstance(error, HttpError):
+        return _rate_limited(error) or error.resp.status in RETRY_STATUSES
+    return isinstance(error, (asyncio.TimeoutError, OSError, httplib2.HttpLib2Error))
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures and refuses calls for ``reset_after`` seconds.
+
+    Once that passes a single probe call is let through (half-open): success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_after=60.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        """Raise :class:`CircuitOpenError` while open; returns True if this call is the half-open probe.
+
+        The probe's caller must hand it back with :meth:`release_probe` when the
+        call ends, however it ends.
+        """
+        if self.opened_at is None:
+            return False
+        if self._probing or time.monotonic() - self.opened_at < self.reset_after:
+            raise CircuitOpenError(f"Calendar API circuit open after {self.failures} failures")
+        self._probing = True
+        return True
+
+    def release_probe(self):
+        self._probing = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            log.info("[calendar] API กลับมาใช้ได้แล้ว ปิด circuit")
+        self.failures = 0
+        self.opened_at = None
+        calendar_circuit_open.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                log.warning("[calendar] API ล้มเหลว %d ครั้งติด เปิด circuit %.0fs", self.failures, self.reset_after)
+            self.opened_at = time.monotonic()
+            calendar_circuit_open.set(1)
+
+
+class AsyncCalendarClient:
+    """Runs blocking googleapiclient requests on a bounded thread pool.
+
+    httplib2 is not thread-safe, so each worker thread gets its own
+    authorized Http object instead of sharing the one inside the service;
+    those per-thread connections are kept alive and reused. Transient
+    failures are retried with exponential backoff and jitter (non-idempotent
+    calls only on rate limits), and a circuit breaker stops hammering an API
+    that is down, so callers fall back to what they already have.
+
+    The service object is built on first use from the discovery document
+    bundled with google-api-python-client, so startup neither imports the
+    discovery machinery nor touches the network for it.
+    """
+
+    def __init__(self, credentials, max_workers=4, max_concurrency=4, timeout=20,
+                 retries=4, backoff=1.0, max_backoff=32.0, breaker=None):
+        self.credentials = credentials
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._service = None
+        # ให้มี thread (= connection) พอสำหรับทุก request ที่วิ่งพร้อมกัน
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, max_concurrency),
+                                            thread_name_prefix="calendar")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._refresh_lock = asyncio.Lock()
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        if self._service is None:
+            from googleapiclient.discovery import build
+            self._service = build('calendar', 'v3', credentials=self.credentials,
+                                  static_discovery=True, cache_discovery=False)
+        return self._service
+
+    def events(self):
+        return self.service.events()
+
+    def channels(self):
+        return self.service.channels()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+            self._local.http = http
+        return http
+
+    def _execute_blocking(self, request):
+        return request.execute(http=self._http())
+
+    def _refresh_blocking(self):
+        self.credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=self.timeout)))
+
+    async def _ensure_token(self):
+        expiry = getattr(self.credentials, 'expiry', None)
+        # expiry ของ google-auth เป็นเวลา UTC แบบ naive
+        if self.credentials.token and expiry and expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+            return
+        async with self._refresh_lock:
+            expiry = getattr(self.credentials, 'expiry', None)
+            if self.credentials.token and expiry and expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+                return
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._refresh_blocking)
+
+    def _delay(self, attempt, error):
+        retry_after = None
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get('retry-after')
+        if retry_after and str(retry_after).isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _attempt(self, request, method, timeout):
+        async with self._semaphore:
+            await self._ensure_token()
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, self._execute_blocking, request)
+            try:
+                result = await asyncio.wait_for(future, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                calendar_api_calls.inc(method=method, outcome="timeout")
+                raise
+            except Exception:
+                calendar_api_calls.inc(method=method, outcome="error")
+                raise
+            calendar_api_calls.inc(method=method, outcome="ok")
+            return result
+
+    async def execute(self, request, timeout=None):
+        """Execute a prepared request, e.g. ``client.events().list(...)``, without blocking the loop.
+
+        Raises :class:`CircuitOpenError` without calling the API while the breaker is open.
+        """
+        method = getattr(request, 'methodId', None) or 'batch'
+        try:
+            probe = self.breaker.before_call()
+        except CircuitOpenError:
+            calendar_api_calls.inc(method=method, outcome="circuit_open")
+            raise
+
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    result = await self._attempt(request, method, timeout)
+                except Exception as e:
+                    if not _transient(e):
+                        # 4xx ของเราเอง (404, 410 ฯลฯ) แปลว่า API ยังทำงานปกติ
+                        self.breaker.record_success()
+                        raise
+                    retryable = method in IDEMPOTENT_METHODS or _rate_limited(e)
+                    if attempt == self.retries or not retryable:
+                        self.breaker.record_failure()
+                        raise
+                    delay = self._delay(attempt, e)
+                    log.debug("[calendar] %s ล้มเหลว (%s) ลองใหม่ใน %.1fs", method, e, delay)
+                    calendar_api_calls.inc(method=method, outcome="retry")
+                    await asyncio.sleep(delay)
+                else:
+                    self.breaker.record_success()
+                    return result
+        finally:
+            # เฉพาะการเรียกที่เป็น probe เท่านั้นที่คืน probe การเรียกที่เริ่มก่อน circuit เปิดไม่เกี่ยว
+            if probe:
+                self.breaker.release_probe()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
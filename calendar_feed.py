@@ -0,0 +1,65 @@
+import asyncio
+from datetime import timezone
+
+from calendar_sync import EventStore, iter_events
+from event_index import EventIndex
+from month_view import MonthViewCache, month_bounds, render_month
+from rendering import event_times
+from reminders import ReminderScheduler
+
+
+class CalendarFeed:
+    """Everything derived from one calendar: store, month views, title index and reminders.
+
+    There is one feed per calendar id, shared by every guild that points at
+    that calendar, so N guilds on the same calendar cost one sync.
+    ``fire(feed, event, kind, fire_at)`` is called for each due reminder and
+    ``kinds(event)`` picks which reminders an event gets.
+    """
+
+    def __init__(self, client, calendar_id, fire, kinds=None, month_cache_size=24, month_cache_ttl=600,
+                 clock=None):
+        self.client = client
+        self.calendar_id = calendar_id
+        self.store = EventStore(client, calendar_id)
+        self.month_views = MonthViewCache(max_entries=month_cache_size, ttl=month_cache_ttl)
+        self.index = EventIndex()
+        self.reminders = ReminderScheduler(lambda event, kind, fire_at: fire(self, event, kind, fire_at), kinds, clock)
+        self.store.add_listener(self.month_views.on_event_changed)
+        self.store.add_listener(self.index.on_event_changed)
+        self.store.add_listener(self.reminders.on_event_changed)
+        self._task = None
+
+    async def month_text(self, year, month, tz):
+        """The rendered schedule of one month in ``tz``, from the cache when possible."""
+        cached = self.month_views.get(year, month, tz)
+        if cached is not None:
+            return cached
+
+        start_of_month, next_month = month_bounds(year, month, tz)
+        if self.store.covers(start_of_month, next_month):
+            events = self.store.between(start_of_month, next_month)
+        else:
+            # เดือนที่เก่ากว่าข้อมูลที่ซิงก์ไว้ ต้องถาม API ตรง
+            events = [event async for event in iter_events(
+                self.client, self.calendar_id,
+                timeMin=start_of_month.astimezone(timezone.utc).isoformat(),
+                timeMax=next_month.astimezone(timezone.utc).isoformat(),
+                singleEvents=True, orderBy='startTime'
+            )]
+            for event in events:
+                event_times(event, self.store.tz)
+
+        text = render_month(events, year, month, tz)
+        self.month_views.put(year, month, text, tz)
+        return text
+
+    def start(self):
+        """Start firing reminders; call from inside the running loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.reminders.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,216 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from googleapiclient.errors import HttpError
+
+from instrumentation import log
+from recurrence import expand, instance_id
+from rendering import DEFAULT_TZ, event_times, zone
+
+TH_TZ = DEFAULT_TZ
+
+# ขอเฉพาะฟิลด์ที่ใช้จริง payload จะได้ไม่ใหญ่ตาม resource เต็มของ event
+EVENT_FIELDS = "id,status,etag,summary,description,start,end,recurrence,recurringEventId,originalStartTime"
+LIST_FIELDS = f"items({EVENT_FIELDS}),nextPageToken,nextSyncToken,timeZone"
+PAGE_SIZE = 2500
+
+
+def event_start(event):
+    return event_times(event).start
+
+
+def event_end(event):
+    return event_times(event).end
+
+
+async def iter_pages(client, calendar_id, **params):
+    """Yield every page of an events.list call, following nextPageToken."""
+    params.setdefault('fields', LIST_FIELDS)
+    params.setdefault('maxResults', PAGE_SIZE)
+    page_token = None
+    while True:
+        page = await client.execute(client.events().list(
+            calendarId=calendar_id, pageToken=page_token, **params))
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+async def iter_events(client, calendar_id, **params):
+    """Lazily yield events for any range size, one page at a time."""
+    async for page in iter_pages(client, calendar_id, **params):
+        for item in page.get('items', []):
+            yield item
+
+
+class EventStore:
+    """In-memory mirror of one calendar, kept current with syncToken incremental sync.
+
+    Recurring events are pulled as masters (``singleEvents=False``) and
+    expanded locally up to ``horizon`` ahead, with modified and cancelled
+    instances applied on top. ``items`` holds what the API returned;
+    ``events`` holds the individual occurrences everything else works with.
+    """
+
+    def __init__(self, client, calendar_id, lookback=timedelta(days=45), horizon=timedelta(days=400)):
+        self.client = client
+        self.calendar_id = calendar_id
+        self.lookback = lookback
+        self.horizon = horizon
+        self.items = {}
+        self.events = {}
+        self.sync_token = None
+        self.window_start = None
+        self.window_end = None
+        self.last_sync = None
+        # เขตเวลาของตัวปฏิทิน ใช้กำหนดเที่ยงคืนของกิจกรรมทั้งวัน อ่านจาก response ของ list
+        self.tz = DEFAULT_TZ
+        self._exceptions = {}
+        self._members = {}
+        self._lock = asyncio.Lock()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Register ``callback(event_id, old, new)``; ``new`` is None when the event is gone."""
+        self._listeners.append(callback)
+
+    def _changed(self, event_id, old, new):
+        for callback in self._listeners:
+            try:
+                callback(event_id, old, new)
+            except Exception as e:
+                log.exception("[sync-listener] %s: %s", event_id, e)
+
+    async def _pull(self, **params):
+        items = []
+        async for page in iter_pages(self.client, self.calendar_id, singleEvents=False, **params):
+            self.tz = zone(page.get('timeZone'), self.tz)
+            items.extend(page.get('items', []))
+        # nextSyncToken มากับหน้าสุดท้ายเท่านั้น
+        return items, page.get('nextSyncToken')
+
+    @staticmethod
+    def _series(item):
+        return item.get('recurringEventId') or item['id']
+
+    def _store(self, item):
+        """Keep one raw item and return the series it belongs to."""
+        series = self._series(item)
+        if item.get('recurringEventId'):
+            # ครั้งที่ถูกแก้/ถูกยกเลิกของกิจกรรมซ้ำ เก็บไว้ทับผลการกระจายเสมอ แม้สถานะจะเป็น cancelled
+            self._exceptions.setdefault(series, {})[item['id']] = item
+            self.items[item['id']] = item
+        elif item.get('status') == 'cancelled':
+            self.items.pop(item['id'], None)
+            # ลบทั้งชุด ครั้งที่เคยแก้ไว้ก็หายไปด้วย
+            for exception_id in self._exceptions.pop(item['id'], {}):
+                self.items.pop(exception_id, None)
+        else:
+            self.items[item['id']] = item
+        return series
+
+    def _expand(self, series):
+        master = self.items.get(series)
+        exceptions = self._exceptions.get(series, {})
+        if master is None:
+            # ไม่รู้จักตัวหลัก แสดงครั้งที่ถูกแก้เป็นกิจกรรมเดี่ยวไปก่อน
+            return {i: e for i, e in exceptions.items() if e.get('status') != 'cancelled'}
+        if 'recurrence' not in master:
+            return {series: master}
+
+        instances = {e['id']: e for e in expand(master, self.window_start, self.window_end, self.tz)}
+        for item in exceptions.values():
+            instances.pop(instance_id(series, item.get('originalStartTime') or item['start']), None)
+            if item.get('status') != 'cancelled':
+                instances[item['id']] = item
+        return instances
+
+    def _rebuild(self, series_ids):
+        """Re-derive the occurrences of each series and notify listeners of the difference."""
+        changed = []
+        for series in series_ids:
+            old_ids = self._members.pop(series, set())
+            new = self._expand(series)
+            for event_id in old_ids | new.keys():
+                old, event = self.events.get(event_id), new.get(event_id)
+                if old is not None and event is not None and old.get('etag') == event.get('etag') \
+                        and old['start'] == event['start']:
+                    continue
+                if event is None:
+                    del self.events[event_id]
+                else:
+                    event_times(event, self.tz)
+                    self.events[event_id] = event
+                changed.append(event_id)
+                self._changed(event_id, old, event)
+            if new:
+                self._members[series] = set(new)
+        return changed
+
+    async def full_sync(self):
+        now = datetime.now(timezone.utc)
+        items, token = await self._pull(timeMin=(now - self.lookback).isoformat())
+        self.window_start, self.window_end = now - self.lookback, now + self.horizon
+        self.items, self._exceptions = {}, {}
+        series = {self._store(item) for item in items}
+        self.sync_token = token
+        self.last_sync = datetime.now(timezone.utc)
+        return self._rebuild(series | self._members.keys())
+
+    async def sync(self):
+        """Fetch only what changed since the last sync and return the ids that changed."""
+        async with self._lock:
+            return await self._sync()
+
+    async def _sync(self):
+        if self.sync_token is None:
+            return await self.full_sync()
+        try:
+            items, token = await self._pull(syncToken=self.sync_token)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            # token หมดอายุ (410 Gone) ต้องซิงก์ใหม่ทั้งหมด
+            log.warning("[sync] syncToken หมดอายุ กำลังซิงก์ใหม่ทั้งหมด...")
+            return await self.full_sync()
+
+        series = {self._store(item) for item in items}
+        now = datetime.now(timezone.utc)
+        if now + self.horizon - self.window_end > timedelta(days=1):
+            # เลื่อนขอบเขตการกระจายกิจกรรมซ้ำไปข้างหน้าวันละครั้ง
+            self.window_end = now + self.horizon
+            series |= {i for i, item in self.items.items() if 'recurrence' in item}
+        self.sync_token = token
+        self.last_sync = datetime.now(timezone.utc)
+        return self._rebuild(series)
+
+    def put(self, event):
+        """Apply the result of our own insert/update without waiting for the next sync."""
+        self._rebuild([self._store(event)])
+
+    def discard(self, event_id):
+        event = self.events.get(event_id) or self.items.get(event_id)
+        if event is None:
+            return
+        if event.get('recurringEventId'):
+            # ลบครั้งเดียวของกิจกรรมซ้ำ = ยกเลิกครั้งนั้น ไม่ใช่ลบทั้งชุด
+            event = dict(event, status='cancelled', originalStartTime=event.get('originalStartTime') or event['start'])
+        else:
+            event = {'id': event_id, 'status': 'cancelled'}
+        self._rebuild([self._store(event)])
+
+    def covers(self, start, end=None):
+        if self.window_start is None or start < self.window_start:
+            return False
+        return end is None or end <= self.window_end
+
+    def between(self, start, end):
+        """Events overlapping [start, end), ordered by start time."""
+        found = [e for e in self.events.values() if event_start(e) < end and event_end(e) > start]
+        return sorted(found, key=event_start)
+
+    def upcoming(self, now):
+        """Events that have not ended yet (same semantics as timeMin=now)."""
+        found = [e for e in self.events.values() if event_end(e) > now]
+        return sorted(found, key=event_start)
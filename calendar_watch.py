@@ -0,0 +1,192 @@
+import asyncio
+import hmac
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from calendar_client import CircuitOpenError
+from instrumentation import log
+from metrics import Counter, Gauge
+from state_store import atomic_write_text
+
+push_notifications = Counter(
+    "calendar_push_notifications_total", "Calendar push notifications received by outcome", ["outcome"])
+watched_calendars = Gauge("calendar_watched", "Calendars with a live push notification channel")
+
+
+class CalendarWatcher:
+    """Keeps one Calendar ``events.watch`` channel per calendar and resyncs on every push.
+
+    Google posts to ``address`` whenever something in a watched calendar
+    changes; :meth:`handle` answers at once and runs ``resync(calendar_id)``
+    in the background, coalescing bursts into one sync at a time per
+    calendar. Channels are renewed ``renew_before`` ahead of expiry and kept
+    in ``path`` so a restart reuses them instead of registering new ones.
+    :meth:`watching` is False for a calendar whose channel could not be set
+    up, and the caller keeps polling it at the normal rate.
+    """
+
+    def __init__(self, client, path, address, token, resync, ttl=timedelta(days=7),
+                 renew_before=timedelta(hours=6), retry_after=600):
+        self.client = client
+        self.path = Path(path)
+        self.address = address
+        self.token = token
+        self.resync = resync
+        self.ttl = ttl
+        self.renew_before = renew_before
+        self.retry_after = retry_after
+        # calendar_id -> {"id", "resource_id", "expiration", "renew_at"} (unix ms แบบเดียวกับที่ API ส่งมา)
+        self.channels = {}
+        self._failed = {}
+        self._dirty = set()
+        self._syncing = {}
+        self._wakeup = asyncio.Event()
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.channels = json.load(f)
+            watched_calendars.set(len(self.channels))
+        except (OSError, ValueError) as e:
+            log.warning("[watch] อ่าน %s ไม่ได้: %s", self.path, e)
+
+    def _save(self):
+        atomic_write_text(self.path, json.dumps(self.channels, indent=1))
+        watched_calendars.set(len(self.channels))
+
+    def _expires(self, channel):
+        return datetime.fromtimestamp(int(channel["expiration"]) / 1000, timezone.utc)
+
+    def _renew_at(self, channel):
+        if "renew_at" in channel:
+            return datetime.fromtimestamp(channel["renew_at"] / 1000, timezone.utc)
+        return self._expires(channel) - self.renew_before
+
+    def watching(self, calendar_id):
+        channel = self.channels.get(calendar_id)
+        return channel is not None and self._expires(channel) > datetime.now(timezone.utc)
+
+    def wake(self):
+        """Reconcile now, e.g. after a guild switched to a new calendar."""
+        self._wakeup.set()
+
+    async def _register(self, calendar_id):
+        body = {
+            "id": str(uuid.uuid4()),
+            "type": "web_hook",
+            "address": self.address,
+            "token": self.token,
+            "params": {"ttl": str(int(self.ttl.total_seconds()))},
+        }
+        response = await self.client.execute(self.client.events().watch(calendarId=calendar_id, body=body))
+        channel = {"id": response["id"], "resource_id": response["resourceId"],
+                   "expiration": int(response.get("expiration") or 0)}
+        # Google อาจให้อายุสั้นกว่าที่ขอ ถ้าสั้นกว่า renew_before ให้ต่ออายุตอนครึ่งทางแทน
+        now = datetime.now(timezone.utc)
+        expires = self._expires(channel)
+        renew_at = max(expires - self.renew_before, now + (expires - now) / 2)
+        channel["renew_at"] = int(renew_at.timestamp() * 1000)
+        return channel
+
+    async def _stop(self, channel):
+        try:
+            await self.client.execute(self.client.channels().stop(
+                body={"id": channel["id"], "resourceId": channel["resource_id"]}))
+        except Exception as e:
+            # ช่องที่หยุดไม่สำเร็จจะหมดอายุเอง การแจ้งที่มาจากช่องนั้นจะถูกเมิน
+            log.warning("[watch] หยุด channel %s ไม่ได้: %s", channel["id"], e)
+
+    async def _renew(self, calendar_id):
+        old = self.channels.get(calendar_id)
+        try:
+            channel = await self._register(calendar_id)
+        except Exception as e:
+            self._failed[calendar_id] = datetime.now(timezone.utc)
+            log.warning("[watch] %s: ลงทะเบียน push ไม่ได้ (%s) ใช้การ poll ปกติแทน", calendar_id, e)
+            return
+        self._failed.pop(calendar_id, None)
+        self.channels[calendar_id] = channel
+        self._save()
+        log.info("[watch] %s: รับ push ถึง %s", calendar_id, self._expires(channel).isoformat())
+        # ลงทะเบียนช่องใหม่ก่อนค่อยหยุดช่องเก่า จะได้ไม่มีช่วงที่พลาดการแจ้ง
+        if old is not None:
+            await self._stop(old)
+
+    async def reconcile(self, calendar_ids):
+        """Watch every calendar in ``calendar_ids``, renew channels near expiry and drop the rest."""
+        now = datetime.now(timezone.utc)
+        for calendar_id in set(self.channels) - set(calendar_ids):
+            await self._stop(self.channels.pop(calendar_id))
+            self._save()
+        for calendar_id in calendar_ids:
+            channel = self.channels.get(calendar_id)
+            if channel is not None and self._renew_at(channel) > now:
+                continue
+            failed = self._failed.get(calendar_id)
+            if failed is not None and (now - failed).total_seconds() < self.retry_after:
+                continue
+            await self._renew(calendar_id)
+
+    def _next_check(self):
+        now = datetime.now(timezone.utc)
+        waits = [(self._renew_at(channel) - now).total_seconds()
+                 for channel in self.channels.values()]
+        if self._failed or not waits:
+            waits.append(self.retry_after)
+        return max(min(waits), 1.0)
+
+    async def run(self, calendar_ids):
+        """Keep channels registered and fresh; ``calendar_ids()`` returns what should be watched."""
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.reconcile(calendar_ids())
+            except Exception as e:
+                log.exception("[watch] %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_check())
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self, calendar_id):
+        """Resync ``calendar_id`` soon; pushes that arrive mid-sync cause exactly one more sync."""
+        self._dirty.add(calendar_id)
+        task = self._syncing.get(calendar_id)
+        if task is None or task.done():
+            self._syncing[calendar_id] = asyncio.get_running_loop().create_task(self._drain(calendar_id))
+
+    async def _drain(self, calendar_id):
+        while calendar_id in self._dirty:
+            self._dirty.discard(calendar_id)
+            try:
+                await self.resync(calendar_id)
+            except CircuitOpenError:
+                return
+            except Exception as e:
+                log.error("[watch] resync %s: %s", calendar_id, e)
+
+    def handle(self, headers):
+        """Handle one push request; returns the HTTP status to answer with.
+
+        Google retries on anything but 2xx, so notifications for channels we no
+        longer know are still acknowledged and just ignored.
+        """
+        channel_id = headers.get("X-Goog-Channel-ID")
+        if not hmac.compare_digest(headers.get("X-Goog-Channel-Token", "").encode(), self.token.encode()):
+            push_notifications.inc(outcome="bad_token")
+            return 403
+        calendar_id = next((cid for cid, channel in self.channels.items() if channel["id"] == channel_id), None)
+        if calendar_id is None:
+            push_notifications.inc(outcome="unknown_channel")
+            return 200
+        state = headers.get("X-Goog-Resource-State")
+        push_notifications.inc(outcome=state or "unknown")
+        # "sync" มาครั้งแรกตอนเปิดช่อง ไม่มีอะไรเปลี่ยน
+        if state != "sync":
+            self.notify(calendar_id)
+        return 200
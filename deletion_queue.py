@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import discord
+
+from instrumentation import log
+from state_store import atomic_write_text
+
+# Discord ลบแบบ bulk ได้ครั้งละไม่เกิน 100 ข้อความ และต้องอายุไม่เกิน 14 วัน
+BULK_LIMIT = 100
+BULK_MAX_AGE = timedelta(days=14)
+
+
+class DeletionQueue:
+    """Scheduled message deletions driven by one timer loop.
+
+    Pending deletions live in a heap and are journaled to disk, so they
+    survive restarts. Messages that come due together in the same channel
+    are removed with one bulk ``delete_messages`` call where Discord allows.
+    """
+
+    def __init__(self, bot, path, batch_window=2.0):
+        self.bot = bot
+        self.path = Path(path)
+        self.batch_window = batch_window
+        self._heap = []
+        self._pending = {}
+        self._lines = 0
+        self._file = None
+        self._wakeup = asyncio.Event()
+        self._load()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._lines += 1
+            if record.get("d"):
+                self._pending.pop(record["m"], None)
+            else:
+                self._pending[record["m"]] = (record["c"], record["t"])
+        self._heap = [(due, channel_id, message_id) for message_id, (channel_id, due) in self._pending.items()]
+        heapq.heapify(self._heap)
+        self._compact()
+
+    def _append(self, record):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._lines += 1
+
+    def _compact(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        atomic_write_text(self.path, "".join(
+            json.dumps({"c": channel_id, "m": message_id, "t": due}) + "\n"
+            for message_id, (channel_id, due) in self._pending.items()))
+        self._lines = len(self._pending)
+
+    def schedule(self, message, delay):
+        """Delete ``message`` after ``delay`` seconds, even across a restart."""
+        self.add(message.channel.id, message.id, time.time() + delay)
+
+    def add(self, channel_id, message_id, due):
+        self._pending[message_id] = (channel_id, due)
+        heapq.heappush(self._heap, (due, channel_id, message_id))
+        self._append({"c": channel_id, "m": message_id, "t": due})
+        self._wakeup.set()
+
+    def _done(self, message_ids):
+        for message_id in message_ids:
+            if self._pending.pop(message_id, None) is not None:
+                self._append({"m": message_id, "d": 1})
+        if self._lines > 2 * len(self._pending) + 100:
+            self._compact()
+
+    def _pop_due(self, now):
+        """Group everything due by ``now`` (plus the batch window) per channel."""
+        by_channel = {}
+        while self._heap and self._heap[0][0] <= now + self.batch_window:
+            due, channel_id, message_id = heapq.heappop(self._heap)
+            if self._pending.get(message_id) != (channel_id, due):
+                continue
+            by_channel.setdefault(channel_id, []).append(message_id)
+        return by_channel
+
+    async def _delete_one(self, channel, message_id):
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass
+
+    async def _delete(self, channel_id, message_ids):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+
+        cutoff = datetime.now(timezone.utc) - BULK_MAX_AGE
+        bulk = [mid for mid in message_ids if discord.utils.snowflake_time(mid) > cutoff]
+        single = [mid for mid in message_ids if mid not in bulk]
+        if len(bulk) > 1 and hasattr(channel, "delete_messages"):
+            for i in range(0, len(bulk), BULK_LIMIT):
+                chunk = bulk[i:i + BULK_LIMIT]
+                try:
+                    await channel.delete_messages([discord.Object(id=mid) for mid in chunk])
+                except (discord.Forbidden, discord.HTTPException):
+                    # ไม่มีสิทธิ์ Manage Messages หรือบางข้อความถูกลบไปแล้ว ลบทีละข้อความแทน
+                    single.extend(chunk)
+        else:
+            single.extend(bulk)
+
+        for message_id in single:
+            try:
+                await self._delete_one(channel, message_id)
+            except Exception as e:
+                log.error("[delete] ลบข้อความ %s ไม่ได้: %s", message_id, e)
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            for channel_id, message_ids in self._pop_due(time.time()).items():
+                try:
+                    await self._delete(channel_id, message_ids)
+                except Exception as e:
+                    log.error("[delete] ลบข้อความในช่อง %s ไม่ได้: %s", channel_id, e)
+                self._done(message_ids)
+
+            self._wakeup.clear()
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+import discord
+
+from instrumentation import log, timings
+from metrics import messages_sent, send_failures
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+
+def chunk_lines(lines, limit=DISCORD_MESSAGE_LIMIT, header=""):
+    """Pack lines into as few messages as possible, each under Discord's length limit."""
+    chunks = []
+    current = header
+    for line in lines:
+        line = line[:limit - 1]
+        if current and len(current) + len(line) + 1 > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass
+class DispatchReport:
+    """Outcome of one fan-out: what was sent, what failed and how long it took."""
+    results: dict = field(default_factory=dict)
+    failures: dict = field(default_factory=dict)
+    latencies: dict = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def sent(self):
+        return [result for result in self.results.values() if result is not None]
+
+    def summary(self):
+        slowest = max(self.latencies.values(), default=0.0)
+        return (f"สำเร็จ {len(self.results)}/{len(self.results) + len(self.failures)} ช่อง "
+                f"ใช้เวลา {self.elapsed:.2f}s (ช้าสุด {slowest:.2f}s)")
+
+
+class RouteBucket:
+    """Token bucket for one Discord route (channel): ``rate`` sends every ``per`` seconds."""
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+
+def _is_retryable(error):
+    # discord.py ลองใหม่เองแล้วทั้ง 429 และ 5xx ที่หลุดมาถึงนี่คือมันยอมแพ้แล้ว
+    # ส่วน timeout/การเชื่อมต่อหลุด ข้อความอาจส่งไปแล้ว ลองซ้ำจะได้ข้อความซ้ำ
+    return isinstance(error, discord.HTTPException) and error.status == 429
+
+
+class Dispatcher:
+    """Sends to many channels at once with a concurrency cap, per-channel
+    rate limiting and a retry for 429s that discord.py gave up on."""
+
+    def __init__(self, max_concurrency=10, rate=5, per=5.0, retries=3, backoff=0.5):
+        self.retries = retries
+        self.backoff = backoff
+        self.rate = rate
+        self.per = per
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def prune(self):
+        """Forget buckets that have refilled completely; they hold no rate-limit state."""
+        now = time.monotonic()
+        for route, bucket in list(self._buckets.items()):
+            if not bucket.lock.locked() and now - bucket.updated >= bucket.per:
+                del self._buckets[route]
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = RouteBucket(self.rate, self.per)
+        return bucket
+
+    async def _run_one(self, channel, action, report):
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            try:
+                await self._bucket(channel.id).acquire()
+                async with self._semaphore:
+                    report.results[channel.id] = await action(channel)
+                messages_sent.inc()
+                break
+            except Exception as e:
+                if attempt == self.retries or not _is_retryable(e):
+                    report.failures[channel.id] = e
+                    send_failures.inc()
+                    log.error("[dispatch] %s: %s", getattr(channel, 'name', channel.id), e)
+                    break
+                delay = getattr(e, 'retry_after', None) or self.backoff * 2 ** attempt
+                await asyncio.sleep(delay)
+        report.latencies[channel.id] = time.monotonic() - started
+
+    async def fan_out(self, channels, action):
+        """Run ``action(channel)`` for every channel concurrently and report the results."""
+        report = DispatchReport()
+        started = time.monotonic()
+        with timings.span("dispatch", channels=len(channels)) as span:
+            await asyncio.gather(*(self._run_one(channel, action, report) for channel in channels))
+            span["failed"] = len(report.failures)
+        report.elapsed = time.monotonic() - started
+        return report
+
+    async def send(self, channels, content, **kwargs):
+        return await self.fan_out(channels, lambda channel: channel.send(content, **kwargs))
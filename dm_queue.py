@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import discord
+
+from dispatcher import Dispatcher, RouteBucket, chunk_lines
+from instrumentation import log
+from metrics import Gauge
+
+dm_queue_members = Gauge("dm_queue_members", "Members with direct messages waiting to be sent")
+
+
+class DirectMessageQueue:
+    """Personal reminder DMs, coalesced per member and sent at a bounded rate.
+
+    Lines queued for the same member within ``window`` seconds go out as one
+    message (identical lines once), so reminders that fall due together
+    arrive as a single DM. Every send takes a token from one shared bucket
+    (``rate`` per ``per`` seconds) on top of the dispatcher's per-route limit
+    and retries, so a reminder for a large team trickles out instead of
+    tripping Discord's global limit. ``resolve(member_id)`` returns something
+    with ``send`` (a ``discord.User``) or None; members whose DMs are closed
+    are passed to ``on_forbidden``.
+    """
+
+    def __init__(self, resolve, window=5.0, rate=5, per=1.0, max_concurrency=2, on_forbidden=None):
+        self.resolve = resolve
+        self.window = window
+        self.on_forbidden = on_forbidden
+        self._bucket = RouteBucket(rate, per)
+        self._dispatcher = Dispatcher(max_concurrency=max_concurrency)
+        self._pending = {}
+        self._due = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def enqueue(self, member_id, line):
+        lines = self._pending.get(member_id)
+        if lines is None:
+            # dict ใช้แทน ordered set: บรรทัดซ้ำ (เช่นอยู่หลายกิลด์ที่ใช้ปฏิทินเดียวกัน) ส่งครั้งเดียว
+            lines = self._pending[member_id] = {}
+            self._due[member_id] = time.monotonic() + self.window
+            self._wakeup.set()
+        lines[line] = None
+        dm_queue_members.set(len(self._pending))
+
+    def _pop_due(self, now):
+        due = [member_id for member_id, at in self._due.items() if at <= now]
+        batches = {}
+        for member_id in due:
+            del self._due[member_id]
+            batches[member_id] = list(self._pending.pop(member_id))
+        dm_queue_members.set(len(self._pending))
+        return batches
+
+    async def _send(self, user, lines):
+        sent = []
+        for chunk in chunk_lines(lines):
+            await self._bucket.acquire()
+            sent.append(await user.send(chunk))
+        return sent
+
+    async def flush(self, now=None):
+        """Send everything due at ``now`` (monotonic); returns the DispatchReport or None."""
+        batches = self._pop_due(time.monotonic() if now is None else now)
+        if not batches:
+            return None
+        users = {}
+        for member_id in batches:
+            user = await self.resolve(member_id)
+            if user is None:
+                log.info("[dm] ไม่พบสมาชิก %s ข้าม", member_id)
+                continue
+            users[user.id] = user
+        report = await self._dispatcher.fan_out(list(users.values()), lambda user: self._send(user, batches[user.id]))
+        for member_id, error in report.failures.items():
+            if isinstance(error, discord.Forbidden) and self.on_forbidden:
+                self.on_forbidden(member_id)
+        log.info("✉️ ส่ง DM เตือน %s", report.summary())
+        return report
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                log.exception("[dm] %s", e)
+            timeout = None
+            if self._due:
+                timeout = max(min(self._due.values()) - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
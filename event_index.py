@@ -0,0 +1,107 @@
+import difflib
+import unicodedata
+from datetime import timedelta, timezone
+
+from calendar_sync import event_start
+from rendering import DEFAULT_TZ, event_times
+
+FUZZY_CUTOFF = 0.75
+
+
+def normalize_title(title):
+    """NFC + casefold + collapsed whitespace, so typed Thai/English titles compare equal."""
+    return " ".join(unicodedata.normalize("NFC", title or "").casefold().split())
+
+
+def _minute(dt):
+    return int(dt.timestamp() // 60)
+
+
+class EventIndex:
+    """Hash indexes over the EventStore, maintained through its change listener.
+
+    Events are indexed by normalized title, by start minute (UTC epoch
+    minutes, timed events only) and by start date in UTC, which ``on_day``
+    narrows down to the caller's time zone.
+    """
+
+    def __init__(self):
+        self._events = {}
+        self._keys = {}
+        self._by_title = {}
+        self._by_minute = {}
+        self._by_day = {}
+
+    def __len__(self):
+        return len(self._events)
+
+    @staticmethod
+    def _add(table, key, event_id):
+        table.setdefault(key, set()).add(event_id)
+
+    @staticmethod
+    def _remove(table, key, event_id):
+        ids = table.get(key)
+        if ids is not None:
+            ids.discard(event_id)
+            if not ids:
+                del table[key]
+
+    def on_event_changed(self, event_id, old, new):
+        keys = self._keys.pop(event_id, None)
+        if keys is not None:
+            title, minute, day = keys
+            self._remove(self._by_title, title, event_id)
+            self._remove(self._by_day, day, event_id)
+            if minute is not None:
+                self._remove(self._by_minute, minute, event_id)
+            self._events.pop(event_id, None)
+        if new is None:
+            return
+
+        start = event_start(new)
+        title = normalize_title(new.get('summary'))
+        minute = _minute(start) if 'dateTime' in new['start'] else None
+        day = start.astimezone(timezone.utc).date()
+        self._keys[event_id] = (title, minute, day)
+        self._events[event_id] = new
+        self._add(self._by_title, title, event_id)
+        self._add(self._by_day, day, event_id)
+        if minute is not None:
+            self._add(self._by_minute, minute, event_id)
+
+    def at(self, start):
+        """Timed events starting within a minute of ``start``."""
+        minute = _minute(start)
+        found = []
+        for bucket in (minute - 1, minute, minute + 1):
+            for event_id in self._by_minute.get(bucket, ()):
+                event = self._events[event_id]
+                if abs((event_start(event) - start).total_seconds()) < 60:
+                    found.append(event)
+        return found
+
+    def on_day(self, day, tz=DEFAULT_TZ):
+        """Events starting on ``day`` (a date in ``tz``), ordered by start."""
+        found = [self._events[event_id]
+                 for utc_day in (day - timedelta(days=1), day, day + timedelta(days=1))
+                 for event_id in self._by_day.get(utc_day, ())]
+        return sorted((e for e in found if event_times(e).local(tz).dt.date() == day), key=event_start)
+
+    def match(self, title, start):
+        """Events at ``start`` whose title matches exactly, else by prefix or similarity."""
+        candidates = self.at(start)
+        wanted = normalize_title(title)
+
+        same_title = self._by_title.get(wanted, ())
+        exact = [e for e in candidates if e['id'] in same_title]
+        if exact:
+            return exact
+
+        prefix = [e for e in candidates if normalize_title(e.get('summary')).startswith(wanted)]
+        if prefix:
+            return prefix
+
+        titles = {normalize_title(e.get('summary')): e for e in candidates}
+        close = difflib.get_close_matches(wanted, list(titles), n=3, cutoff=FUZZY_CUTOFF)
+        return [titles[t] for t in close]
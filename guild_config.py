@@ -0,0 +1,151 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from instrumentation import log
+from reminders import DEFAULT_REMINDERS
+from rendering import DEFAULT_TIMEZONE, zone
+from state_store import atomic_write_text
+
+
+@dataclass
+class GuildConfig:
+    calendar_id: str
+    role_id: int
+    channel_ids: list = field(default_factory=list)
+    voice_channel_id: int = None
+    timezone: str = DEFAULT_TIMEZONE
+    # None = DEFAULT_REMINDERS; กิจกรรมที่มีป้าย reminders: ในคำอธิบายใช้ของกิจกรรมเอง
+    reminders: list = None
+    # สมาชิกที่ขอรับการเตือนทาง DM ด้วย
+    dm_member_ids: list = field(default_factory=list)
+    # โพสต์สรุปเวลาที่อยู่ในห้องตอนกิจกรรมจบ (ปิดไว้ก่อน เปิดด้วย !durationreport on)
+    duration_report: bool = False
+
+    @property
+    def tz(self):
+        # ZoneInfo แคชอ็อบเจกต์ตามชื่อไว้เอง เรียกซ้ำไม่เปิดไฟล์ใหม่
+        return zone(self.timezone)
+
+    @property
+    def reminder_kinds(self):
+        return DEFAULT_REMINDERS if self.reminders is None else tuple(self.reminders)
+
+
+class GuildConfigStore:
+    """Per-guild settings held in memory and written atomically on every change.
+
+    Guilds that were never configured fall back to the defaults (the
+    calendar and role from the environment), so a single-team deployment
+    keeps working without any setup.
+    """
+
+    def __init__(self, path, calendar_id, role_id, timezone=DEFAULT_TIMEZONE):
+        self.path = Path(path)
+        self.defaults = {"calendar_id": calendar_id, "role_id": role_id, "timezone": timezone}
+        self._configs = {}
+        self.loaded = False
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                self._configs = {int(guild_id): GuildConfig(**entry) for guild_id, entry in data.items()}
+                self.loaded = True
+            except (AttributeError, TypeError, ValueError) as e:
+                # ย้ายไฟล์เสียไปเป็น .bak ก่อนจะมีการเขียนทับ และไม่ย้ายค่ารุ่นเก่ามาทับ
+                backup = self.path.with_name(self.path.name + ".bak")
+                os.replace(self.path, backup)
+                self.loaded = True
+                log.error("[config] อ่าน %s ไม่ได้ (%s) ย้ายไปไว้ที่ %s แล้วใช้ค่าเริ่มต้น", self.path, e, backup)
+
+    def __len__(self):
+        return len(self._configs)
+
+    def _save(self):
+        atomic_write_text(self.path, json.dumps(
+            {str(guild_id): asdict(config) for guild_id, config in self._configs.items()}))
+
+    def get(self, guild_id):
+        """The guild's config, or an unsaved one built from the defaults."""
+        config = self._configs.get(guild_id)
+        return config if config is not None else GuildConfig(**self.defaults)
+
+    def update(self, guild_id, **changes):
+        config = self._configs.get(guild_id) or GuildConfig(**self.defaults)
+        for key, value in changes.items():
+            setattr(config, key, value)
+        self._configs[guild_id] = config
+        self._save()
+        return config
+
+    def add_channel(self, guild_id, channel_id):
+        config = self.get(guild_id)
+        if channel_id in config.channel_ids:
+            return False
+        self.update(guild_id, channel_ids=config.channel_ids + [channel_id])
+        return True
+
+    def remove_channel(self, guild_id, channel_id):
+        config = self.get(guild_id)
+        if channel_id not in config.channel_ids:
+            return False
+        self.update(guild_id, channel_ids=[c for c in config.channel_ids if c != channel_id])
+        return True
+
+    def subscribe_dm(self, guild_id, member_id):
+        config = self.get(guild_id)
+        if member_id in config.dm_member_ids:
+            return False
+        self.update(guild_id, dm_member_ids=config.dm_member_ids + [member_id])
+        return True
+
+    def unsubscribe_dm(self, guild_id, member_id):
+        config = self.get(guild_id)
+        if member_id not in config.dm_member_ids:
+            return False
+        self.update(guild_id, dm_member_ids=[m for m in config.dm_member_ids if m != member_id])
+        return True
+
+    def forget(self, guild_id):
+        if self._configs.pop(guild_id, None) is not None:
+            self._save()
+
+    def items(self):
+        return list(self._configs.items())
+
+    def calendar_ids(self):
+        """Every calendar some guild uses; the default one is always included."""
+        return {self.defaults["calendar_id"]} | {config.calendar_id for config in self._configs.values()}
+
+    def guilds_for(self, calendar_id):
+        return [(guild_id, config) for guild_id, config in self._configs.items()
+                if config.calendar_id == calendar_id]
+
+    def migrate_legacy(self, channel_ids, voice_ids, guild_of):
+        """Fold the old global ``channels.json`` / ``voice_id.json`` into per-guild configs.
+
+        ``guild_of(channel_id)`` maps a channel to its guild id (None if the
+        bot can no longer see it). Runs only while no config file exists.
+        Entries that are not a guild id (the old ``"voice_channel_id": 0``
+        placeholder) and unset channel ids are skipped.
+        """
+        if self.loaded:
+            return 0
+        for channel_id in channel_ids:
+            if not channel_id:
+                continue
+            guild_id = guild_of(channel_id)
+            if guild_id is None:
+                log.warning("[config] ไม่พบช่อง %s ข้ามการย้ายค่า", channel_id)
+                continue
+            config = self._configs.setdefault(guild_id, GuildConfig(**self.defaults))
+            if channel_id not in config.channel_ids:
+                config.channel_ids.append(channel_id)
+        for guild_id, voice_channel_id in voice_ids.items():
+            if not str(guild_id).isdigit() or not voice_channel_id:
+                continue
+            config = self._configs.setdefault(int(guild_id), GuildConfig(**self.defaults))
+            config.voice_channel_id = voice_channel_id
+        self._save()
+        self.loaded = True
+        return len(self._configs)
@@ -0,0 +1,121 @@
+import asyncio
+import gc
+import os
+import tracemalloc
+
+from instrumentation import log
+from metrics import Gauge
+
+process_memory = Gauge("process_memory_bytes", "Resident memory of the bot process")
+traced_memory = Gauge("python_traced_memory_bytes", "Memory allocated by Python (tracemalloc)")
+asyncio_tasks = Gauge("asyncio_tasks", "Live asyncio tasks")
+cache_entries = Gauge("cache_entries", "Entries held by each in-memory cache", ["cache"])
+
+
+def resident_memory():
+    """RSS in bytes from /proc, or None where that is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class HealthMonitor:
+    """Samples memory, task and cache sizes and cleans up what crosses a threshold.
+
+    Caches register a size function, a cleanup function and a limit. When the
+    process itself grows past ``memory_limit`` every cleanup runs. With
+    ``trace_frames`` set, the first crossing starts tracemalloc and later ones
+    log the top allocation sites since then. Only if memory is still above
+    ``restart_limit`` after that is ``on_restart`` called.
+    """
+
+    def __init__(self, interval=300, memory_limit=None, restart_limit=None, task_limit=500,
+                 trace_frames=0, on_restart=None):
+        self.interval = interval
+        self.memory_limit = memory_limit
+        self.restart_limit = restart_limit
+        self.task_limit = task_limit
+        self.on_restart = on_restart
+        self.trace_frames = trace_frames
+        self._caches = {}
+        self._baseline = None
+
+    def register_cache(self, name, size, cleanup, limit=None):
+        self._caches[name] = (size, cleanup, limit)
+
+    def sample(self):
+        stats = {"rss": resident_memory(), "tasks": len(asyncio.all_tasks())}
+        if tracemalloc.is_tracing():
+            stats["traced"], stats["traced_peak"] = tracemalloc.get_traced_memory()
+        stats["caches"] = {name: size() for name, (size, _, _) in self._caches.items()}
+
+        if stats["rss"] is not None:
+            process_memory.set(stats["rss"])
+        if "traced" in stats:
+            traced_memory.set(stats["traced"])
+        asyncio_tasks.set(stats["tasks"])
+        for name, entries in stats["caches"].items():
+            cache_entries.set(entries, cache=name)
+        return stats
+
+    def _cleanup(self, names):
+        for name in names:
+            try:
+                self._caches[name][1]()
+            except Exception as e:
+                log.exception("[health] ล้าง %s ไม่สำเร็จ: %s", name, e)
+        gc.collect()
+
+    def _log_top_allocations(self, limit=10):
+        # tracemalloc ทำให้ทุก allocation ช้าลงและกินหน่วยความจำเอง เริ่มเก็บตอนเกินกำหนดครั้งแรกเท่านั้น
+        # แล้วเทียบกับ snapshot ตอนนั้นในครั้งต่อ ๆ ไป
+        if not self.trace_frames:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._baseline = tracemalloc.take_snapshot()
+            log.info("[health] เริ่ม tracemalloc จะแสดงจุดที่หน่วยความจำโตเมื่อเกินกำหนดครั้งถัดไป")
+            return
+        snapshot = tracemalloc.take_snapshot()
+        if self._baseline is None:
+            self._baseline = snapshot
+            return
+        for stat in snapshot.compare_to(self._baseline, "lineno")[:limit]:
+            log.warning("[health] %s", stat)
+
+    async def check(self):
+        stats = self.sample()
+        log.debug("[health] %s", stats)
+
+        over = [name for name, (_, _, limit) in self._caches.items()
+                if limit is not None and stats["caches"][name] > limit]
+        if over:
+            log.info("[health] cache เกินขนาด: %s", ", ".join(over))
+            self._cleanup(over)
+
+        if stats["tasks"] > self.task_limit:
+            names = sorted((task.get_coro().__qualname__ for task in asyncio.all_tasks()), key=str)
+            log.warning("[health] asyncio tasks %d เกิน %d: %s", stats["tasks"], self.task_limit, names[:20])
+
+        rss = stats["rss"]
+        if rss is None or self.memory_limit is None or rss <= self.memory_limit:
+            return stats
+
+        log.warning("[health] หน่วยความจำ %.1f MB เกินกำหนด กำลังล้าง cache ทั้งหมด", rss / 2**20)
+        self._log_top_allocations()
+        self._cleanup(list(self._caches))
+        rss = resident_memory()
+        if self.restart_limit is not None and rss is not None and rss > self.restart_limit and self.on_restart:
+            log.warning("[health] ล้างแล้วยังเกิน %.1f MB จะรีสตาร์ทโปรเซส", rss / 2**20)
+            await self.on_restart()
+        return stats
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                log.exception("[health] %s", e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,75 @@
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+log = logging.getLogger("taklye")
+
+SLOW_SPAN_SECONDS = float(os.getenv("SLOW_SPAN_SECONDS", "2"))
+
+
+def configure_logging():
+    """LOG_LEVEL=DEBUG shows every span; the default INFO only shows slow ones.
+
+    Library loggers (discord, googleapiclient) stay at WARNING.
+    """
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+    )
+    log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Timings:
+    """Ring buffers of recent durations/values per series name."""
+
+    def __init__(self, size=512):
+        self.size = size
+        self._series = {}
+
+    def record(self, name, value):
+        series = self._series.get(name)
+        if series is None:
+            series = self._series[name] = deque(maxlen=self.size)
+        series.append(value)
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Time a block, keep the duration and log it as ``span=<name> ms=<n> key=value ...``."""
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            elapsed = time.perf_counter() - started
+            self.record(name, elapsed)
+            level = logging.WARNING if elapsed >= SLOW_SPAN_SECONDS else logging.DEBUG
+            if log.isEnabledFor(level):
+                extra = " ".join(f"{k}={v}" for k, v in fields.items())
+                log.log(level, "span=%s ms=%.2f %s", name, elapsed * 1000, extra)
+
+    def summary(self, name):
+        """``{count, p50, p99, max}`` over the retained window, or None if nothing was recorded."""
+        series = self._series.get(name)
+        if not series:
+            return None
+        ordered = sorted(series)
+        return {
+            "count": len(ordered),
+            "p50": _percentile(ordered, 50),
+            "p99": _percentile(ordered, 99),
+            "max": ordered[-1],
+        }
+
+    def names(self):
+        return sorted(self._series)
+
+
+timings = Timings()
@@ -1,33 +1,133 @@
+import time
+# จับเวลาตั้งแต่ก่อน import ตัวหนัก ๆ เพื่อดูว่าการ restart แต่ละครั้งช้าตรงไหน
+PROCESS_STARTED = time.perf_counter()
+
 import discord
 import json
 import asyncio
+from contextlib import contextmanager
 from pathlib import Path
 from discord.ext import commands, tasks
 from datetime import datetime, timedelta, timezone
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 import os
 import sys
 import re
-from dateutil.parser import isoparse
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from aiohttp import web
-import threading
-import unicodedata
-
+from calendar_sync import TH_TZ, event_start, event_end, EVENT_FIELDS
+from rendering import event_times, zone
+from state_store import ExpiringKeyStore
+from dispatcher import Dispatcher, chunk_lines
+from presence import PresenceTracker, checkin_messages
+from attendance import AttendanceStore
+from deletion_queue import DeletionQueue
+from month_view import event_months
+from schedule_board import ScheduleBoard
+from bulk_import import parse_lines, parse_csv, parse_ics, submit
+from calendar_client import AsyncCalendarClient, CircuitOpenError
+from calendar_feed import CalendarFeed
+from calendar_watch import CalendarWatcher
+from dm_queue import DirectMessageQueue
+from reminders import event_policy, parse_reminders, reminder_offset
+from guild_config import GuildConfigStore
+from instrumentation import configure_logging, log, timings
+from health_monitor import HealthMonitor
+from metrics import render_metrics, calendar_sync_seconds, calendar_last_sync, reminder_lag_seconds
+
+
+configure_logging()
+
+@contextmanager
+def startup_phase(name):
+    """Time one startup step and log it with the time since the process started."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        timings.record(f"startup.{name}", now - started)
+        log.info("[startup] %s %.0fms (t+%.0fms)", name, (now - started) * 1000, (now - PROCESS_STARTED) * 1000)
 
 TOKEN = os.getenv("DISCORD_TOKEN")
 CALENDAR_ID = os.getenv("CALENDAR_ID")
 CHANNELS_FILE = "channels.json"
 NOTIFIED_FILE = "notified.json"
-ROLE_ID = 1361252742521290866
+CHECKED_IN_FILE = "checked_in.json"
+ROLE_ID = int(os.getenv("ROLE_ID", "1361252742521290866"))
 VOICE_ID_FILE = "voice_id.json"
+GUILD_CONFIG_FILE = "guild_config.json"
+DELETE_QUEUE_FILE = "delete_queue.jsonl"
+ATTENDANCE_DB = "attendance.db"
+SCHEDULE_BOARD_FILE = "schedule_messages.json"
+WEB_PORT = int(os.getenv("PORT", "8080"))
+READY_SYNC_MAX_AGE = 300
+# โหมด push: ตั้ง URL สาธารณะ (https) ที่ชี้มาที่ web server นี้ และ token ลับไว้ตรวจว่าเป็น Google จริง
+WATCH_URL = os.getenv("CALENDAR_WEBHOOK_URL")
+WATCH_TOKEN = os.getenv("CALENDAR_WEBHOOK_TOKEN")
+WATCH_STATE_FILE = "watch_channels.json"
+# ปฏิทินที่รับ push ได้ยัง poll กันพลาดอยู่ แต่ห่าง ๆ
+WATCH_POLL_INTERVAL = int(os.getenv("WATCH_POLL_INTERVAL", "900"))
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 creds_json = os.getenv("GOOGLE_CREDS")
 creds_dict = json.loads(creds_json)
 creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
 
-calendar_service = build('calendar', 'v3', credentials=creds)
+calendar_client = AsyncCalendarClient(
+    creds,
+    max_workers=int(os.getenv("CALENDAR_MAX_WORKERS", "4")),
+    max_concurrency=int(os.getenv("CALENDAR_MAX_CONCURRENCY", "4")),
+    timeout=float(os.getenv("CALENDAR_TIMEOUT", "20")),
+    retries=int(os.getenv("CALENDAR_RETRIES", "4")),
+)
+
+# ตั้งค่าแยกตามกิลด์ (ปฏิทิน, role, ช่อง, ห้องเสียง, เขตเวลา) กิลด์ที่ยังไม่ตั้งใช้ค่าจาก env
+guild_configs = GuildConfigStore(GUILD_CONFIG_FILE, CALENDAR_ID, ROLE_ID)
+
+# ปฏิทินละ 1 feed ใช้ร่วมกันทุกกิลด์ที่ตั้งปฏิทินเดียวกัน ซิงก์ครั้งเดียวต่อรอบ
+feeds = {}
+
+def feed_for(calendar_id):
+    feed = feeds.get(calendar_id)
+    if feed is None:
+        feed = feeds[calendar_id] = CalendarFeed(
+            calendar_client, calendar_id, fire_reminder, scheduled_kinds(calendar_id),
+            month_cache_size=int(os.getenv("MONTH_CACHE_SIZE", "24")),
+            month_cache_ttl=float(os.getenv("MONTH_CACHE_TTL", "600")),
+        )
+        feed.store.add_listener(on_schedule_event_changed)
+        if startup_done:
+            feed.start()
+        if calendar_watcher:
+            calendar_watcher.wake()
+    return feed
+
+def guild_feed(guild):
+    return feed_for(guild_configs.get(guild.id).calendar_id)
+
+def retire_unused_feeds():
+    in_use = guild_configs.calendar_ids()
+    for calendar_id in [cid for cid in feeds if cid not in in_use]:
+        feeds.pop(calendar_id).stop()
+    if calendar_watcher:
+        calendar_watcher.wake()
+
+async def push_resync(calendar_id):
+    feed = feeds.get(calendar_id)
+    if feed is not None:
+        await sync_feed(feed)
+
+calendar_watcher = CalendarWatcher(
+    calendar_client, WATCH_STATE_FILE, WATCH_URL, WATCH_TOKEN, push_resync,
+) if WATCH_URL and WATCH_TOKEN else None
+
+def sync_interval(feed):
+    """How stale ``feed`` may get before polling it: long while push notifications cover it."""
+    if calendar_watcher and calendar_watcher.watching(feed.calendar_id):
+        return WATCH_POLL_INTERVAL
+    return check_calendar.seconds
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -35,113 +135,158 @@ intents.voice_states = True
 intents.members = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# ใครถือ role / ใครอยู่ห้องไหน อัปเดตจาก event ของ gateway ไม่ต้องไล่ดูสมาชิกทั้งเซิร์ฟ
+presence = PresenceTracker(lambda guild_id: guild_configs.get(guild_id).role_id)
+attendance_store = AttendanceStore(ATTENDANCE_DB)
+
 def load_channels():
+    # channels.json / voice_id.json รูปแบบเดิม อ่านครั้งเดียวตอนย้ายไป guild_config.json
     if Path(CHANNELS_FILE).exists():
         with open(CHANNELS_FILE, "r") as f:
             return json.load(f).get("channel_ids", [])
     return []
 
-def save_channels(channel_ids):
-    with open(CHANNELS_FILE, "w") as f:
-        json.dump({"channel_ids": channel_ids}, f)
-
-channel_ids = load_channels()
-
-def load_notified():
-    if Path(NOTIFIED_FILE).exists():
-        try:
-            with open(NOTIFIED_FILE, "r") as f:
-                data = json.load(f)
-                return set(data) if isinstance(data, list) else set()
-        except json.JSONDecodeError:
-            print("[WARN] notified.json ว่างหรือเสียหาย กำลังรีเซ็ต...")
-            return set()
-    return set()
-
-already_notified = load_notified()
-
-def save_notified(data):
-    with open(NOTIFIED_FILE, "w") as f:
-        json.dump(list(data), f)
+def load_voice_id():
+    if Path(VOICE_ID_FILE).exists():
+        with open(VOICE_ID_FILE, "r") as f:
+            return json.load(f)
+    return {}
 
-def load_checked_in():
-    try:
-        with open("checked_in.json", "r") as f:
-            return set(json.load(f))
-    except:
-        return set()
+def migrate_legacy_config():
+    def guild_of(channel_id):
+        channel = bot.get_channel(channel_id)
+        return channel.guild.id if channel else None
+
+    migrated = guild_configs.migrate_legacy(load_channels(), load_voice_id(), guild_of)
+    if migrated:
+        log.info("📦 ย้ายการตั้งค่าเดิมไป %s แล้ว %d กิลด์", GUILD_CONFIG_FILE, migrated)
+
+dispatcher = Dispatcher(max_concurrency=int(os.getenv("DISPATCH_CONCURRENCY", "10")))
+
+def config_for(channel):
+    return guild_configs.get(channel.guild.id)
+
+def feed_channels(calendar_id):
+    """Text channels of every guild that follows ``calendar_id``."""
+    channels = []
+    for _, config in guild_configs.guilds_for(calendar_id):
+        channels.extend(channel for channel in map(bot.get_channel, config.channel_ids) if channel)
+    return channels
+
+def all_channels():
+    return [channel for calendar_id in guild_configs.calendar_ids() for channel in feed_channels(calendar_id)]
+
+# เก็บแบบ append-only และลบ key ของกิจกรรมที่จบไปแล้วอัตโนมัติ
+already_notified = ExpiringKeyStore(NOTIFIED_FILE)
+already_checked_in = ExpiringKeyStore(CHECKED_IN_FILE)
+# key รุ่นก่อนแยกหลายปฏิทินไม่มี calendar id นำหน้า (event|kind และ event) ทั้งหมดมาจากปฏิทินหลัก
+already_notified.rename(lambda key: key if key.count("|") >= 2 else f"{CALENDAR_ID}|{key}")
+already_checked_in.rename(lambda key: key if "|" in key else f"{CALENDAR_ID}|{key}")
+
+def notified_expiry(event):
+    # หลังกิจกรรมจบไม่มีการแจ้งเตือนอีกแล้ว เก็บ key ไว้อีกนิดกันส่งซ้ำ
+    return event_end(event) + timedelta(days=1)
+
+def readiness():
+    """Return (ready, reason): gateway connected and the calendar synced recently."""
+    if bot.is_closed() or not bot.is_ready():
+        return False, "gateway not connected"
+    if not feeds or any(feed.store.last_sync is None for feed in feeds.values()):
+        return False, "calendar never synced"
+    now = datetime.now(timezone.utc)
+    for feed in feeds.values():
+        age = (now - feed.store.last_sync).total_seconds()
+        if age <= READY_SYNC_MAX_AGE + sync_interval(feed) - check_calendar.seconds:
+            continue
+        if calendar_client.breaker.is_open:
+            return False, f"calendar API unavailable, serving snapshot from {age:.0f}s ago"
+        return False, f"last calendar sync {age:.0f}s ago"
+    return True, "ok"
 
-def save_checked_in(data):
-    with open("checked_in.json", "w") as f:
-        json.dump(list(data), f)
+async def create_web_server():
+    """Create the web server for UptimeRobot monitoring and Prometheus scraping"""
+    async def alive(request):
+        return web.Response(text="Bot is alive!", status=200)
 
-already_checked_in = load_checked_in()
+    async def health_check(request):
+        ready, reason = readiness()
+        return web.Response(text="Bot is running!" if ready else f"Not ready: {reason}", status=200 if ready else 503)
 
-def get_upcoming_events():
-    now = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-    events_result = calendar_service.events().list(
-        calendarId=CALENDAR_ID, timeMin=now,
-        maxResults=10, singleEvents=True,
-        orderBy='startTime').execute()
-    return events_result.get('items', [])
+    async def metrics_handler(request):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
 
-async def create_web_server():
-    """Create a simple web server for UptimeRobot monitoring"""
-    async def health_check(request):
-        return web.Response(text="Bot is running!", status=200)
+    async def calendar_push(request):
+        # ตอบ Google ทันที ส่วนการซิงก์ไปทำเบื้องหลัง
+        return web.Response(status=calendar_watcher.handle(request.headers))
 
     app = web.Application()
-    app.router.add_get('/', health_check)
+    app.router.add_get('/', alive)
     app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics_handler)
+    if calendar_watcher:
+        app.router.add_post(urlsplit(WATCH_URL).path or '/', calendar_push)
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)
+    site = web.TCPSite(runner, '0.0.0.0', WEB_PORT)
     await site.start()
-    print("✅ Web server started on port 8080")
+    print(f"✅ Web server started on port {WEB_PORT}")
+    return runner
 
-async def delete_later(message, delay):
-    await asyncio.sleep(delay)
-    try:
-        await message.delete()
-    except:
-        pass
+# คิวลบข้อความตัวเดียวทั้งบอท เก็บลงไฟล์ด้วย รีสตาร์ทแล้วก็ยังลบตามเวลาเดิม
+deletion_queue = DeletionQueue(bot, DELETE_QUEUE_FILE)
 
-def save_voice_id(data):
-    with open(VOICE_ID_FILE, "w") as f:
-        json.dump(data, f)
+def delete_later(message, delay):
+    deletion_queue.schedule(message, delay)
 
-def load_voice_id():
-    if Path(VOICE_ID_FILE).exists():
-        with open(VOICE_ID_FILE, "r") as f:
-            return json.load(f)
-    return {}
+async def send_paged(channel, lines, header):
+    return [await channel.send(chunk) for chunk in chunk_lines(lines, header=header)]
 
-async def checkin_members(title, date_str, voice_channel_id, text_channel):
-    try:
-        role = discord.utils.get(text_channel.guild.roles, id=ROLE_ID)
-        voice_channel = text_channel.guild.get_channel(voice_channel_id)
+async def checkin_members(title, date_str, voice_channel_id, text_channel, event=None):
+    """Post who holding the guild's role is in the voice channel right now; returns the sent messages.
 
-        if not voice_channel:
-            return await text_channel.send("❌ ไม่พบห้องพูดคุยที่ตั้งไว้ กรุณาตรวจสอบ `!setvoice`")
+    When ``event`` is given the result is also written to the attendance history.
+    """
+    try:
+        guild = text_channel.guild
+        if not guild.get_channel(voice_channel_id):
+            return [await text_channel.send("❌ ไม่พบห้องพูดคุยที่ตั้งไว้ กรุณาตรวจสอบ `!setvoice`")]
 
-        members_in_voice = [member for member in voice_channel.members]
-        all_members = [member for member in text_channel.guild.members if role in member.roles]
+        role_members, present = presence.roll_call(guild.id, voice_channel_id)
 
-        lines = []
-        for member in all_members:
-            symbol = "✅" if member in members_in_voice else "❌"
-            lines.append(f"- {member.display_name} {symbol}")
+        if event is not None:
+            await asyncio.to_thread(
+                attendance_store.record_checkin, guild.id, event['id'], title,
+                event_start(event), event_end(event), role_members, present)
 
-        names = "\n".join(lines) if lines else "ไม่มีใครอยู่ในห้อง"
-        message = f"📝 `{title}` {date_str} เช็คชื่อ:\n{names}"
-        return await text_channel.send(message)
+        return [await text_channel.send(chunk) for chunk in checkin_messages(title, date_str, role_members, present)]
 
     except Exception as e:
         print(f"[ERROR-checkin_members] {e}")
-        return await text_channel.send("⚠️ เกิดข้อผิดพลาดในการเช็คชื่อ")
-
-async def show_month_events_internal(arg: str = None, *, year: int = None, month: int = None):
+        return [await text_channel.send("⚠️ เกิดข้อผิดพลาดในการเช็คชื่อ")]
+
+async def record_durations(event, guild_id, voice_channel_id):
+    """Store how long each member spent in the voice channel during the event; returns the durations."""
+    durations = presence.attendance(guild_id, voice_channel_id, event_start(event), event_end(event))
+    await asyncio.to_thread(attendance_store.record_durations, guild_id, event['id'], durations)
+    return durations
+
+async def attendance_summary(event, text_channel, durations):
+    """Post how long each role member spent in the voice channel during the event."""
+    title = event.get('summary', 'ไม่ระบุชื่อกิจกรรม')
+    start, end = event_start(event), event_end(event)
+    role_members = presence.role_members(text_channel.guild.id)
+    length = max((end - start).total_seconds(), 1)
+
+    lines = []
+    for member_id, name in sorted(role_members.items(), key=lambda item: -durations.get(item[0], 0)):
+        seconds = durations.get(member_id, 0)
+        lines.append(f"- {name} {int(seconds // 60)} นาที ({seconds / length:.0%})")
+    if not lines:
+        return []
+    return await send_paged(text_channel, lines, f"⏱️ `{title}` สรุปเวลาที่อยู่ในห้อง:")
+
+async def show_month_events_internal(feed, arg: str = None, *, year: int = None, month: int = None, tz=TH_TZ):
     try:
         if isinstance(arg, str) and arg.strip():
             match = re.match(r"(\d{2})/(\d{4})", arg.strip())
@@ -151,41 +296,10 @@ async def show_month_events_internal(arg: str = None, *, year: int = None, month
         elif year is not None and month is not None:
             pass  # ใช้ year และ month จาก argument
         else:
-            now = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=7)))
+            now = datetime.now(tz)
             year, month = now.year, now.month
 
-        month_names_th = [
-            "มกราคม", "กุมภาพันธ์", "มีนาคม", "เมษายน", "พฤษภาคม", "มิถุนายน",
-            "กรกฎาคม", "สิงหาคม", "กันยายน", "ตุลาคม", "พฤศจิกายน", "ธันวาคม"
-        ]
-        month_thai = month_names_th[month - 1]
-
-        start_of_month = datetime(year, month, 1, tzinfo=timezone(timedelta(hours=7)))
-        next_month = datetime(year + int(month == 12), (month % 12) + 1, 1, tzinfo=timezone(timedelta(hours=7)))
-
-        events_result = calendar_service.events().list(
-            calendarId=CALENDAR_ID,
-            timeMin=start_of_month.astimezone(timezone.utc).isoformat(),
-            timeMax=next_month.astimezone(timezone.utc).isoformat(),
-            maxResults=50, singleEvents=True, orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-        if not events:
-            return f"🫰🏽 ไม่มีทั้งแข่งทั้งซ้อมในเดือน {month_thai} {year}"
-
-        response = f"**📅 ตารางซ้อม/แข่งเดือน {month_thai} {year} :**\n"
-        for event in events:
-            title = event.get('summary', 'ไม่ระบุชื่อกิจกรรม')
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            start_dt = datetime.fromisoformat(start)
-            th_time = start_dt.astimezone(timezone(timedelta(hours=7)))
-            date_str = th_time.strftime('%d/%m/%Y')
-            time_24 = th_time.strftime('%H:%M')
-            time_12 = th_time.strftime('%I:%M %p')
-            response += f"- {title} → {date_str} | {time_24} น. | {time_12}\n"
-
-        return response
+        return await feed.month_text(year, month, tz)
 
     except Exception as e:
         print(f"[ERROR-show_month_events_internal] {e}")
@@ -193,175 +307,360 @@ async def show_month_events_internal(arg: str = None, *, year: int = None, month
 
 
 
-async def clean_old_calendar_messages():
-    for cid in channel_ids:
-        channel = bot.get_channel(cid)
-        if channel:
-            try:
-                async for message in channel.history(limit=100):
-                    if message.author == bot.user and "📅 ตารางซ้อม/แข่งเดือน" in message.content:
-                        await message.delete()
-                        print(f"🧹 ลบข้อความตารางเก่าใน {channel.name}")
-            except Exception as e:
-                print(f"[ERROR-ลบข้อความเก่า] {e}")
-
-async def send_monthly_calendar():
-    now = datetime.now(timezone(timedelta(hours=7)))
-    year = now.year
-    month = now.month
-    calendar_text = await show_month_events_internal(arg=f"{month:02d}/{year}")
-
-    if calendar_text:
-        for cid in channel_ids:
-            channel = bot.get_channel(cid)
-            if channel:
-                await channel.send(calendar_text)
-
-start_time = asyncio.get_event_loop().time()
-
-async def background_restart_check():
-    await bot.wait_until_ready()
-    while not bot.is_closed():
-        now = asyncio.get_event_loop().time()
-        uptime = now - start_time
-        if uptime >= 86400:  # 24 ชั่วโมง
-            print("\U0001F501 รีสตาร์ทบอทเพื่อความเสถียร (ครบ 24 ชั่วโมง)")
-            os.execv(sys.executable, [sys.executable] + sys.argv)
-        await asyncio.sleep(60)
+async def clean_old_calendar_messages(channels):
+    """One-time cleanup of schedule posts made before the board tracked its message."""
+    for channel in channels:
+        try:
+            async for message in channel.history(limit=100):
+                if message.author == bot.user and "ตารางซ้อม/แข่งเดือน" in message.content:
+                    await message.delete()
+                    print(f"🧹 ลบข้อความตารางเก่าใน {channel.name}")
+        except Exception as e:
+            print(f"[ERROR-ลบข้อความเก่า] {e}")
+
+def board_groups():
+    """Channels keyed by (calendar, time zone); each group shares one rendered schedule."""
+    groups = {}
+    for calendar_id in list(feeds):
+        for _, config in guild_configs.guilds_for(calendar_id):
+            channels = [channel for channel in map(bot.get_channel, config.channel_ids) if channel]
+            groups.setdefault((calendar_id, config.timezone), []).extend(channels)
+    return groups
+
+async def current_month_schedule(key):
+    calendar_id, timezone_name = key
+    tz = zone(timezone_name)
+    now = datetime.now(tz)
+    text = await show_month_events_internal(feed_for(calendar_id), year=now.year, month=now.month, tz=tz)
+    return now.year, now.month, text
+
+# ข้อความตารางประจำเดือนช่องละ 1 ข้อความ แก้ไขในที่เดิมเมื่อกิจกรรมเดือนนี้เปลี่ยน
+schedule_board = ScheduleBoard(SCHEDULE_BOARD_FILE, dispatcher)
+
+def on_schedule_event_changed(event_id, old, new):
+    # "เดือนนี้" ของแต่ละกิลด์ต่างกันได้ตามเขตเวลา ดูทั้งเดือนก่อนและหลัง 14 ชม. จากตอนนี้
+    now = datetime.now(timezone.utc)
+    current = {(dt.year, dt.month) for dt in (now - timedelta(hours=14), now + timedelta(hours=14))}
+    if any(current.intersection(event_months(event)) for event in (old, new) if event is not None):
+        schedule_board.mark_dirty()
+
+def persist_state():
+    """Flush everything that lives on disk so a restart loses nothing."""
+    already_notified.close()
+    already_checked_in.close()
+    deletion_queue.close()
+    attendance_store.close()
+
+async def drain_tasks():
+    """Cancel every other task and wait for work already handed to ``to_thread``."""
+    current = asyncio.current_task()
+    pending = [task for task in asyncio.all_tasks() if task is not current]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    # task ที่ถูกยกเลิกระหว่างรอ to_thread จบทันที แต่ thread ยังเขียนต่อ รอให้เสร็จก่อนปิดฐานข้อมูล
+    await asyncio.get_running_loop().shutdown_default_executor()
+
+restart_requested = False
+
+async def graceful_restart():
+    # ไม่รีสตาร์ททุก 24 ชม. แล้ว จะเกิดก็ต่อเมื่อ health_monitor ล้าง cache แล้วหน่วยความจำยังเกิน
+    # ปิดบอทให้ main() เก็บงานและบันทึกไฟล์ให้ครบก่อน แล้วค่อย exec โปรเซสใหม่ (ต่อ gateway ใหม่ ไม่ resume session)
+    global restart_requested
+    log.warning("🔁 รีสตาร์ทโปรเซส บันทึกไฟล์สถานะก่อนแล้วเริ่มใหม่")
+    restart_requested = True
+    await bot.close()
+
+health_monitor = HealthMonitor(
+    interval=int(os.getenv("HEALTH_CHECK_INTERVAL", "300")),
+    memory_limit=int(os.getenv("MEMORY_LIMIT_MB", "300")) * 2**20,
+    restart_limit=int(os.getenv("RESTART_MEMORY_MB", "0")) * 2**20 or None,
+    trace_frames=int(os.getenv("TRACEMALLOC_FRAMES", "0")),
+    on_restart=graceful_restart,
+)
+
+startup_done = False
 
 @bot.event
 async def on_ready():
+    global startup_done
     print(f"\u2705 Logged in as {bot.user} (ID: {bot.user.id})")
     print("\U0001F4E1 Bot is now online.")
+    for guild in bot.guilds:
+        presence.seed(guild)
+
+    # on_ready เกิดซ้ำได้ทุกครั้งที่ gateway ต่อใหม่ งานตอนเริ่มต้นทำแค่ครั้งเดียว
+    if startup_done:
+        return
+    startup_done = True
 
+    log.info("[startup] gateway ready t+%.0fms", (time.perf_counter() - PROCESS_STARTED) * 1000)
     try:
-        await clean_old_calendar_messages()
-        await send_monthly_calendar()
-        check_calendar.start()
-        bot.loop.create_task(background_restart_check())  # ⬆️ เพิ่มบรรทัดนี้
+        migrate_legacy_config()
+    except Exception as e:
+        # ไฟล์ตั้งค่ารุ่นเก่าเสียก็ข้ามไป บอทยังต้องเริ่มงานที่เหลือได้
+        log.exception("[config] ย้ายการตั้งค่าเดิมไม่สำเร็จ ข้ามไป: %s", e)
+    try:
+        for calendar_id in guild_configs.calendar_ids():
+            feed_for(calendar_id).start()
+        bot.loop.create_task(deletion_queue.run())
+        bot.loop.create_task(health_monitor.run())
+        bot.loop.create_task(dm_queue.run())
+        # งานหนักทำเบื้องหลัง on_ready จะได้จบทันทีและคำสั่งใช้ได้เลย
+        bot.loop.create_task(background_startup())
     except Exception as e:
         print(f"[ERROR-on_ready] {e}")
 
-@tasks.loop(count=1)
-async def restart_bot_every_24h():
-    await asyncio.sleep(86400)  # รอ 24 ชั่วโมง = 86400 วินาที
-    print("🔁 รีสตาร์ทบอทเพื่อความเสถียร (ครบ 24 ชั่วโมง)")
-    await bot.close()
-    sys.exit(0)
+async def background_startup():
+    """Startup work that can wait until the bot is already answering commands."""
+    try:
+        with startup_phase("initial_sync"):
+            await asyncio.gather(*(sync_feed(feed) for feed in list(feeds.values())))
+        check_calendar.start()
+        if calendar_watcher:
+            bot.loop.create_task(calendar_watcher.run(lambda: list(feeds)))
+
+        untracked = [channel for channel in all_channels() if not schedule_board.tracked(channel.id)]
+        if untracked:
+            with startup_phase("legacy_cleanup"):
+                await clean_old_calendar_messages(untracked)
+        bot.loop.create_task(schedule_board.run(current_month_schedule, board_groups))
+    except Exception as e:
+        log.exception("[startup] %s", e)
 
+@bot.event
+async def on_guild_join(guild):
+    presence.seed(guild)
 
-@tasks.loop(seconds=30)
-async def check_calendar():
-    now = datetime.now(timezone.utc)
-    print(f"[{now.isoformat()}] 🔄 Checking events...")
-    events = get_upcoming_events()
+@bot.event
+async def on_guild_remove(guild):
+    presence.forget(guild.id)
+    # ถูกเตะออกแล้ว ค่าของกิลด์นี้ไม่ใช้อีก ปฏิทินที่ไม่มีใครใช้แล้วก็หยุดตาม
+    guild_configs.forget(guild.id)
+    retire_unused_feeds()
 
-    for event in events:
-        title = event.get('summary', 'ไม่ระบุชื่อกิจกรรม')
-        event_id = event.get('id', 'unknown')
-        is_all_day = 'date' in event['start']
+@bot.event
+async def on_voice_state_update(member, before, after):
+    presence.on_voice_state_update(member, before, after)
 
-        # ✅ แปลงเวลา
-        if is_all_day:
-            start = isoparse(event['start']['date'] + 'T00:00:00+00:00')
-        else:
-            start = isoparse(event['start']['dateTime'])
-
-        delta = start - now
-        th_time = start.astimezone(timezone(timedelta(hours=7)))
-        time_24 = th_time.strftime('%H:%M') if not is_all_day else "ทั้งวัน"
-        time_12 = th_time.strftime('%I:%M %p') if not is_all_day else ""
-
-        print(f"🔍 Event: {title} | All-day: {is_all_day} | เวลาไทย: {time_24} | เหลืออีก {delta}")
-
-        def notify_once(type_name, condition, message):
-            noti_key = f"{event_id}|{type_name}"
-            if condition and noti_key not in already_notified:
-                already_notified.add(noti_key)
-                save_notified(already_notified)
-                print(f"✅ Triggered: {type_name}")
-                return message
+@bot.event
+async def on_member_update(before, after):
+    presence.on_member_update(before, after)
+
+@bot.event
+async def on_member_remove(member):
+    presence.on_member_remove(member)
+
+
+REMINDER_DELETE_AFTER = {"1d": 86400, "today": 86400, "1h": 3600, "10m": 600, "start": 300, "checkout": 3600}
+DURATION_UNITS = {"d": "วัน", "h": "ชั่วโมง", "m": "นาที"}
+
+def reminder_delete_after(kind):
+    # การเตือนที่ตั้งเองลบเมื่อกิจกรรมเริ่ม เหมือนของเดิม
+    if kind in REMINDER_DELETE_AFTER:
+        return REMINDER_DELETE_AFTER[kind]
+    return max(int(reminder_offset(kind).total_seconds()), 300)
+
+def reminder_text(event, kind, tz=TH_TZ):
+    """``(emoji, text)`` of a reminder, or None if ``kind`` has nothing to say for this event."""
+    title = event.get('summary', 'ไม่ระบุชื่อกิจกรรม')
+    local = event_times(event).local(tz)
+    before = f"{kind[:-1]} {DURATION_UNITS.get(kind[-1], '')}"
+
+    if 'date' in event['start']:
+        texts = {
+            "1d": ("📆", f"**พรุ่งนี้** เรามีกิจกรรมทั้งวัน: `{title}`"),
+            "today": ("📣", f"วันนี้มีกิจกรรมทั้งวัน: `{title}`"),
+        }
+        if kind not in texts and kind.endswith("d"):
+            return "📆", f"อีก **{before}** เรามีกิจกรรมทั้งวัน: `{title}`"
+        return texts.get(kind)
+
+    time_24, time_12 = local.time_24, local.time_12
+    texts = {
+        "1d": ("📆", f"**พรุ่งนี้** เรามี `{title}` เวลา {time_24} น. ({time_12})"),
+        "today": ("📣", f"วันนี้เรามี `{title}` เวลา {time_24} น. ({time_12}) "),
+        "1h": ("⏰", f"อีก **1 ชั่วโมง** จะถึงเวลา `{title}` เวลา {time_24} น. ({time_12})"),
+        "10m": ("⚠️", f"`{title}` เวลา {time_24} น. ({time_12}) จะเริ่มในอีก **10 นาที** เตรียมตัวให้พร้อม!"),
+        "start": ("🚀", f"ถึงเวลาเริ่ม `{title}` เวลา {time_24} น. ({time_12}) แล้วใครยังไม่มาถ่ายตูดมาให้กูเดี๋ยวนี้!"),
+    }
+    if kind not in texts and reminder_offset(kind):
+        return "⏰", f"อีก **{before}** จะถึงเวลา `{title}` เวลา {time_24} น. ({time_12})"
+    return texts.get(kind)
+
+def reminder_message(event, kind, role_id, tz=TH_TZ):
+    text = reminder_text(event, kind, tz)
+    if text is None:
+        return None
+    emoji, body = text
+    # role_id เป็น None เมื่อกิจกรรมติดป้าย mention: off
+    mention = f" <@&{role_id}>" if role_id else ""
+    return f"{emoji}{mention}\n# {body}"
+
+def guild_reminders(calendar_id):
+    """Reminders for events without tags: every kind some guild on ``calendar_id`` wants."""
+    configs = [config for _, config in guild_configs.guilds_for(calendar_id)] or [guild_configs.get(None)]
+    kinds = []
+    for config in configs:
+        kinds.extend(kind for kind in config.reminder_kinds if kind not in kinds)
+    return tuple(kinds)
+
+def scheduled_kinds(calendar_id):
+    def kinds(event):
+        policy = event_policy(event)
+        return policy.kinds if policy.kinds is not None else guild_reminders(calendar_id)
+    return kinds
+
+def wants_reminder(event, kind, config):
+    policy = event_policy(event)
+    return kind in (policy.kinds if policy.kinds is not None else config.reminder_kinds)
+
+async def resolve_member(member_id):
+    user = bot.get_user(member_id)
+    if user is None:
+        try:
+            user = await bot.fetch_user(member_id)
+        except discord.HTTPException:
             return None
+    return user
+
+def stop_dm(member_id):
+    # ปิด DM แล้วส่งไปก็โดน 403 ทุกครั้ง เลิกส่งให้จนกว่าจะสมัครใหม่
+    for guild_id, config in guild_configs.items():
+        if member_id in config.dm_member_ids:
+            guild_configs.unsubscribe_dm(guild_id, member_id)
+    log.info("✉️ %s ปิด DM ไว้ ยกเลิกการเตือนทาง DM แล้ว", member_id)
+
+# DM ของหลายการเตือนที่ถึงเวลาพร้อมกันรวมเป็นข้อความเดียว และส่งแบบจำกัดอัตรา
+dm_queue = DirectMessageQueue(
+    resolve_member,
+    window=float(os.getenv("DM_COALESCE_SECONDS", "5")),
+    rate=int(os.getenv("DM_RATE_PER_SECOND", "5")),
+    on_forbidden=stop_dm,
+)
+
+def queue_reminder_dms(feed, event, kind):
+    # คนที่สมัครไว้หลายกิลด์ที่ใช้ปฏิทินเดียวกันได้บรรทัดเดียวกัน คิวจะรวมให้เหลืออันเดียว
+    for _, config in guild_configs.guilds_for(feed.calendar_id):
+        if not config.dm_member_ids or not wants_reminder(event, kind, config):
+            continue
+        emoji, body = reminder_text(event, kind, config.tz)
+        line = f"{emoji} {body}"
+        for member_id in config.dm_member_ids:
+            dm_queue.enqueue(member_id, line)
+
+async def fire_reminder(feed, event, kind, fire_at):
+    # กิจกรรมที่เชิญข้ามปฏิทินมี id เดียวกัน จึงต้องมี calendar id ใน key ด้วย
+    noti_key = f"{feed.calendar_id}|{event['id']}|{kind}"
+    if noti_key in already_notified:
+        return
+    already_notified.add(noti_key, expires_at=notified_expiry(event))
+    lag = (datetime.now(timezone.utc) - fire_at).total_seconds()
+    reminder_lag_seconds.observe(max(lag, 0))
+    timings.record("reminder.lag", max(lag, 0))
+    log.info("✅ Triggered: %s (ช้า %.3fs)", noti_key, lag)
+    channels = feed_channels(feed.calendar_id)
+
+    if kind == "checkin":
+        title = event.get('summary', 'ไม่ระบุชื่อกิจกรรม')
+        already_checked_in.add(f"{feed.calendar_id}|{event['id']}", expires_at=notified_expiry(event))
+        with timings.span("checkin", event=event['id']):
+            report = await dispatcher.fan_out(channels, lambda channel: checkin_members(
+                title, event_times(event).local(config_for(channel).tz).date,
+                config_for(channel).voice_channel_id, channel, event=event))
+        log.info("📝 เช็คชื่อ %s", report.summary())
+        return
+
+    if kind == "checkout":
+        # เก็บเวลาลงประวัติทุกกิลด์ แต่โพสต์สรุปเฉพาะกิลด์ที่เปิด !durationreport ไว้
+        durations = {}
+        for channel in channels:
+            voice_channel_id = config_for(channel).voice_channel_id
+            if channel.guild.id in durations or not channel.guild.get_channel(voice_channel_id or 0):
+                continue
+            durations[channel.guild.id] = await record_durations(event, channel.guild.id, voice_channel_id)
+        channels = [channel for channel in channels
+                    if channel.guild.id in durations and config_for(channel).duration_report]
+        report = await dispatcher.fan_out(channels, lambda channel: attendance_summary(
+            event, channel, durations[channel.guild.id]))
+        log.info("⏱️ สรุปเวลาเข้าห้อง %s", report.summary())
+        for messages in report.sent:
+            for sent in messages:
+                delete_later(sent, reminder_delete_after(kind))
+        return
+
+    if reminder_text(event, kind) is None:
+        return
+    queue_reminder_dms(feed, event, kind)
+    mention = event_policy(event).mention
+    channels = [channel for channel in channels if wants_reminder(event, kind, config_for(channel))]
+    report = await dispatcher.fan_out(channels, lambda channel: channel.send(reminder_message(
+        event, kind, config_for(channel).role_id if mention else None, config_for(channel).tz)))
+    log.info("📤 ส่งแจ้งเตือน %s %s", kind, report.summary())
+    for sent in report.sent:
+        delete_later(sent, reminder_delete_after(kind))
+
+def _expire_sent_keys():
+    for store in (already_notified, already_checked_in):
+        store.expire()
+        store.compact()
+
+def _clear_month_views():
+    for feed in feeds.values():
+        feed.month_views.clear()
+
+def _compact_reminders():
+    for feed in feeds.values():
+        feed.reminders.compact(force=True)
+
+health_monitor.register_cache("month_view", lambda: sum(len(f.month_views) for f in feeds.values()), _clear_month_views)
+health_monitor.register_cache("reminder_heap", lambda: sum(f.reminders.heap_size() for f in feeds.values()),
+                              _compact_reminders, limit=5000)
+health_monitor.register_cache("rate_buckets", lambda: len(dispatcher), dispatcher.prune, limit=500)
+health_monitor.register_cache("notified_keys", lambda: len(already_notified), _expire_sent_keys, limit=10000)
+health_monitor.register_cache("deletion_queue", lambda: len(deletion_queue), lambda: None)
+health_monitor.register_cache("dm_queue", lambda: len(dm_queue), lambda: None)
+
+async def sync_feed(feed):
+    try:
+        started = asyncio.get_running_loop().time()
+        with timings.span("loop.sync", calendar=feed.calendar_id) as span:
+            changed = await feed.store.sync()
+            span["changed"] = len(changed)
+        calendar_sync_seconds.observe(asyncio.get_running_loop().time() - started)
+        if changed:
+            log.info("🔄 ซิงก์ปฏิทิน %s: เปลี่ยน %d รายการ", feed.calendar_id, len(changed))
+    except CircuitOpenError:
+        # API ล่มอยู่ ไม่ยิงซ้ำ ใช้ข้อมูลล่าสุดที่มีในหน่วยความจำไปก่อน
+        log.debug("[sync] %s: circuit เปิดอยู่ ใช้ข้อมูลเดิม", feed.calendar_id)
+    except Exception as e:
+        # ซิงก์ไม่สำเร็จ ใช้ข้อมูลล่าสุดที่มีในหน่วยความจำไปก่อน
+        log.error("[sync] %s: %s", feed.calendar_id, e)
 
-        messages = []
+@tasks.loop(seconds=30)
+async def check_calendar():
+    # ซิงก์เฉพาะส่วนที่เปลี่ยน ปฏิทินละครั้งไม่ว่าจะมีกี่กิลด์ ส่วนการแจ้งเตือนให้ scheduler ของแต่ละ feed ยิงเอง
+    # ปฏิทินที่รับ push อยู่ซิงก์ตอนมีการแจ้ง ที่นี่แค่กันพลาดตาม WATCH_POLL_INTERVAL
+    now = datetime.now(timezone.utc)
+    due = [feed for feed in list(feeds.values())
+           if feed.store.last_sync is None or (now - feed.store.last_sync).total_seconds() >= sync_interval(feed) - 1]
+    await asyncio.gather(*(sync_feed(feed) for feed in due))
+    syncs = [feed.store.last_sync for feed in feeds.values() if feed.store.last_sync]
+    if syncs:
+        calendar_last_sync.set(min(syncs).timestamp())
+
+    for store in (already_notified, already_checked_in):
+        store.expire()
+        store.flush(force=True)
 
-        if is_all_day:
-            messages.append(notify_once("1d", timedelta(hours=23) <= delta <= timedelta(hours=25),
-                f"📆 <@&{ROLE_ID}>\n# **พรุ่งนี้** เรามีกิจกรรมทั้งวัน: `{title}`"))
-            messages.append(notify_once("today", th_time.date() == now.astimezone(timezone(timedelta(hours=7))).date(),
-                f"📣 <@&{ROLE_ID}>\n# วันนี้มีกิจกรรมทั้งวัน: `{title}`"))
-        else:
-            messages.extend([
-                notify_once("1d", timedelta(hours=23, minutes=59) <= delta <= timedelta(hours=24, minutes=1),
-                    f"📆 <@&{ROLE_ID}>\n# **พรุ่งนี้** เรามี `{title}` เวลา {time_24} น. ({time_12})"),
-                notify_once("today", th_time.date() == now.astimezone(timezone(timedelta(hours=7))).date(),
-                    f"📣 <@&{ROLE_ID}>\n# วันนี้เรามี `{title}` เวลา {time_24} น. ({time_12}) "),
-                notify_once("1h", timedelta(minutes=59) <= delta <= timedelta(minutes=61),
-                    f"⏰ <@&{ROLE_ID}>\n# อีก **1 ชั่วโมง** จะถึงเวลา `{title}` เวลา {time_24} น. ({time_12})"),
-                notify_once("10m", timedelta(minutes=9, seconds=30) <= delta <= timedelta(minutes=10, seconds=30),
-                    f"⚠️ <@&{ROLE_ID}>\n# `{title}` เวลา {time_24} น. ({time_12}) จะเริ่มในอีก **10 นาที** เตรียมตัวให้พร้อม!"),
-                notify_once("start", timedelta(seconds=-60) < delta < timedelta(seconds=60),
-                    f"🚀 <@&{ROLE_ID}>\n# ถึงเวลาเริ่ม `{title}` เวลา {time_24} น. ({time_12}) แล้วใครยังไม่มาถ่ายตูดมาให้กูเดี๋ยวนี้!")
-            ])
-
-        delete_times = [86400, 86400, 3600, 600, 300, 300]  # สำหรับ 6 ประเภท
-        for msg, delete_after in zip(messages, delete_times):
-            if msg:
-                for cid in channel_ids:
-                    channel = bot.get_channel(cid)
-                    if channel:
-                        try:
-                            sent = await channel.send(msg)
-                            print(f"📤 ส่งข้อความไปยัง {channel.name}")
-                            asyncio.create_task(delete_later(sent, delete_after))
-                        except Exception as e:
-                            print(f"[ERROR-ส่งข้อความ] {e}")
-
-        checkin_key = f"{event_id}|checkin"
-        if not is_all_day and checkin_key not in already_notified and timedelta(seconds=-60) < delta < timedelta(seconds=60):
-            already_notified.add(checkin_key)
-            save_notified(already_notified)
-            for cid in channel_ids:
-                channel = bot.get_channel(cid)
-                if channel:
-                    voice_channel_id = load_voice_id().get(str(channel.guild.id))
-                    await checkin_members(title, th_time.strftime('%d/%m/%Y'), voice_channel_id, channel)
-
-
-
-
-@tasks.loop(minutes=1)
-async def monthly_summary_notifier():
-    now = datetime.now(timezone(timedelta(hours=7)))
-    if now.day == 1 and now.hour == 0 and now.minute == 0:
-        channel = bot.get_channel(CHANNEL_ID)
-        if not channel:
-            return
-        month_str = now.strftime("%m/%Y")
-        response = await show_month_events_internal(month_str)
-        if response:
-            bot_msg = await channel.send(response)
-            await asyncio.sleep(60)
-            await bot_msg.delete()
-            async for msg in channel.history(limit=10, before=bot_msg.created_at):
-                if msg.author != bot.user:
-                    try:
-                        await msg.delete()
-                        break
-                    except:
-                        pass
 
 @bot.command(name="today")
 async def show_month_events(ctx, *, arg=None):
-    response = await show_month_events_internal(arg)
+    response = await show_month_events_internal(guild_feed(ctx.guild), arg, tz=guild_configs.get(ctx.guild.id).tz)
     if response:
         sent = await ctx.send(response)
-        await asyncio.sleep(60)
-        try:
-            await sent.delete()
-            await ctx.message.delete()
-        except:
-            pass
+        delete_later(sent, 60)
+        delete_later(ctx.message, 60)
 
 @bot.command(name="addtask")
 async def add_event(ctx, *, args):
@@ -374,7 +673,7 @@ async def add_event(ctx, *, args):
         title, date_str, time_str = match.groups()
         date_part = datetime.strptime(date_str, "%d/%m/%Y").date()
         time_part = datetime.strptime(time_str, "%H:%M").time()
-        th_dt = datetime.combine(date_part, time_part).replace(tzinfo=timezone(timedelta(hours=7)))
+        th_dt = datetime.combine(date_part, time_part).replace(tzinfo=guild_configs.get(ctx.guild.id).tz)
         start_utc = th_dt.astimezone(timezone.utc)
 
         event = {
@@ -389,13 +688,35 @@ async def add_event(ctx, *, args):
             },
         }
 
-        calendar_service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
+        feed = guild_feed(ctx.guild)
+        created = await calendar_client.execute(calendar_client.events().insert(
+            calendarId=feed.calendar_id, body=event, fields=EVENT_FIELDS))
+        feed.store.put(created)
         await ctx.send(f"✅ เพิ่มกิจกรรม {title} วันที่ {date_str} เวลา {time_str} น. เรียบร้อย")
     except Exception as e:
         await ctx.send("❌ เกิดข้อผิดพลาดในการเพิ่มกิจกรรม")
         print(f"[ERROR-เพิ่ม] {e}")
 
 
+def describe_candidates(events, tz=TH_TZ):
+    return ", ".join(f"`{e.get('summary', '')}` {event_times(e).local(tz).time_24}" for e in events)
+
+async def resolve_event(ctx, feed, title, target_dt, action):
+    """Find the event a command refers to, or explain to the user why it could not."""
+    matches = feed.index.match(title, target_dt.astimezone(timezone.utc))
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        await ctx.send(f"⚠️ พบหลายกิจกรรมที่ชื่อคล้ายกัน: {describe_candidates(matches, target_dt.tzinfo)} กรุณาระบุชื่อให้ชัดเจนขึ้น")
+        return None
+
+    reply = f"⚠️ ไม่พบกิจกรรมที่ต้องการ{action} (ชื่อหรือเวลาอาจไม่ตรง)"
+    same_day = [e for e in feed.index.on_day(target_dt.date(), target_dt.tzinfo) if 'dateTime' in e['start']]
+    if same_day:
+        reply += f"\nกิจกรรมในวันนั้น: {describe_candidates(same_day, target_dt.tzinfo)}"
+    await ctx.send(reply)
+    return None
+
 @bot.command(name="deltask")
 async def delete_event(ctx, *, args):
     try:
@@ -407,34 +728,16 @@ async def delete_event(ctx, *, args):
         title, date_str, time_str = match.groups()
         date_part = datetime.strptime(date_str, "%d/%m/%Y").date()
         time_part = datetime.strptime(time_str, "%H:%M").time()
-        target_dt = datetime.combine(date_part, time_part).replace(tzinfo=timezone(timedelta(hours=7)))
-        target_utc = target_dt.astimezone(timezone.utc)
-
-        start_utc = datetime.combine(date_part, datetime.min.time()).replace(tzinfo=timezone.utc)
-        end_utc = start_utc + timedelta(days=1)
-
-        events_result = calendar_service.events().list(
-            calendarId=CALENDAR_ID,
-            timeMin=start_utc.isoformat(),
-            timeMax=end_utc.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-        for event in events:
-            ev_title = event.get('summary', '')
-            ev_start_str = event['start'].get('dateTime')
-            if not ev_start_str:
-                continue
+        target_dt = datetime.combine(date_part, time_part).replace(tzinfo=guild_configs.get(ctx.guild.id).tz)
 
-            ev_start = isoparse(ev_start_str)
-            if ev_title == title and abs((ev_start - target_utc).total_seconds()) < 60:
-                calendar_service.events().delete(calendarId=CALENDAR_ID, eventId=event['id']).execute()
-                await ctx.send(f"🗑️ ลบกิจกรรม {title} วันที่ {date_str} เวลา {time_str} น. เรียบร้อยแล้ว")
-                return
+        feed = guild_feed(ctx.guild)
+        event = await resolve_event(ctx, feed, title, target_dt, "ลบ")
+        if event is None:
+            return
 
-        await ctx.send("⚠️ ไม่พบกิจกรรมที่ต้องการลบ (ชื่อหรือเวลาอาจไม่ตรง)")
+        await calendar_client.execute(calendar_client.events().delete(calendarId=feed.calendar_id, eventId=event['id']))
+        feed.store.discard(event['id'])
+        await ctx.send(f"🗑️ ลบกิจกรรม {event.get('summary', title)} วันที่ {date_str} เวลา {time_str} น. เรียบร้อยแล้ว")
     except Exception as e:
         await ctx.send("❌ เกิดข้อผิดพลาดในการลบกิจกรรม")
         print(f"[ERROR-ลบ] {e}")
@@ -451,70 +754,114 @@ async def edit_event(ctx, *, args):
         title, old_date_str, old_time_str, new_date_str, new_time_str = match.groups()
         old_date = datetime.strptime(old_date_str, "%d/%m/%Y").date()
         old_time = datetime.strptime(old_time_str, "%H:%M").time()
-        old_dt = datetime.combine(old_date, old_time).replace(tzinfo=timezone(timedelta(hours=7)))
-        old_utc = old_dt.astimezone(timezone.utc)
-
-        start_utc = datetime.combine(old_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-        end_utc = start_utc + timedelta(days=1)
-
-        events = calendar_service.events().list(
-            calendarId=CALENDAR_ID,
-            timeMin=start_utc.isoformat(),
-            timeMax=end_utc.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute().get('items', [])
-
-        for event in events:
-            ev_title = event.get('summary', '')
-            ev_start_str = event['start'].get('dateTime')
-            if not ev_start_str:
-                continue
+        tz = guild_configs.get(ctx.guild.id).tz
+        old_dt = datetime.combine(old_date, old_time).replace(tzinfo=tz)
 
-            ev_start = isoparse(ev_start_str)
-            norm_ev_title = unicodedata.normalize("NFC", ev_title)
-            norm_title = unicodedata.normalize("NFC", title)
+        feed = guild_feed(ctx.guild)
+        event = await resolve_event(ctx, feed, title, old_dt, "แก้ไข")
+        if event is None:
+            return
 
-            norm_ev_title = unicodedata.normalize("NFC", ev_title)
-            norm_title = unicodedata.normalize("NFC", title)
+        # ใช้เวลาเดิม ถ้าไม่มีข้อมูลใหม่
+        new_date = datetime.strptime(new_date_str, "%d/%m/%Y").date() if new_date_str else old_date
+        new_time = datetime.strptime(new_time_str, "%H:%M").time() if new_time_str else old_time
+        new_dt = datetime.combine(new_date, new_time).replace(tzinfo=tz)
+        new_utc = new_dt.astimezone(timezone.utc)
 
-            if norm_ev_title == norm_title and abs((ev_start - target_utc).total_seconds()) < 60:
+        # แก้เฉพาะเวลา (patch) เพราะ event ใน store มีแค่บางฟิลด์ ถ้า update ทั้งก้อนฟิลด์อื่นจะหาย
+        changes = {
+            'start': {'dateTime': new_utc.isoformat(), 'timeZone': 'UTC'},
+            'end': {'dateTime': (new_utc + timedelta(hours=1)).isoformat(), 'timeZone': 'UTC'},
+        }
+        updated = await calendar_client.execute(calendar_client.events().patch(
+            calendarId=feed.calendar_id, eventId=event['id'], body=changes, fields=EVENT_FIELDS))
+        feed.store.put(updated)
 
+        await ctx.send(f"♻️ แก้ไขกิจกรรม {event.get('summary', title)} เรียบร้อย! → {new_date.strftime('%d/%m/%Y')} {new_time.strftime('%H:%M')} น.")
+    except Exception as e:
+        await ctx.send("❌ เกิดข้อผิดพลาดในการแก้ไขกิจกรรม")
+        print(f"[ERROR-แก้ไข] {e}")
 
-                # ใช้เวลาเดิม ถ้าไม่มีข้อมูลใหม่
-                new_date = datetime.strptime(new_date_str, "%d/%m/%Y").date() if new_date_str else old_date
-                new_time = datetime.strptime(new_time_str, "%H:%M").time() if new_time_str else old_time
-                new_dt = datetime.combine(new_date, new_time).replace(tzinfo=timezone(timedelta(hours=7)))
-                new_utc = new_dt.astimezone(timezone.utc)
+@bot.command(name="importtask")
+async def import_events(ctx, *, args=""):
+    try:
+        rows = []
+        feed = guild_feed(ctx.guild)
+        tz = guild_configs.get(ctx.guild.id).tz
+        for attachment in ctx.message.attachments:
+            text = (await attachment.read()).decode("utf-8-sig")
+            filename = attachment.filename.lower()
+            if filename.endswith(".ics"):
+                rows.extend(parse_ics(text, tz, feed.store.tz))
+            elif filename.endswith(".csv"):
+                rows.extend(parse_csv(text, tz))
+            else:
+                rows.extend(parse_lines(text, tz))
+        rows.extend(parse_lines(args, tz))
+
+        if not rows:
+            await ctx.send("❌ ไม่มีข้อมูลให้นำเข้า กรุณาใช้: !importtask แล้วตามด้วยบรรทัดละรายการ "
+                           "`[add|del|edit] ชื่อ dd/mm/yyyy HH:MM [วันใหม่] [เวลาใหม่]` หรือแนบไฟล์ .csv/.ics")
+            return
 
-                # แก้เวลาใน event เดิม
-                event['start']['dateTime'] = new_utc.isoformat()
-                event['end']['dateTime'] = (new_utc + timedelta(hours=1)).isoformat()
-                calendar_service.events().update(calendarId=CALENDAR_ID, eventId=event['id'], body=event).execute()
+        # ตรวจทุกแถวก่อน ถ้ามีแถวผิดจะยังไม่ส่งอะไรไปที่ API เลย
+        targeted = {}
+        for row in rows:
+            if row.error or row.action == "add":
+                continue
+            matches = feed.index.match(row.title, row.start.astimezone(timezone.utc))
+            if len(matches) > 1:
+                row.error = f"พบหลายกิจกรรม: {describe_candidates(matches, row.tz)}"
+            elif not matches:
+                row.error = "ไม่พบกิจกรรม"
+            elif matches[0]['id'] in targeted:
+                row.error = f"ซ้ำกับแถว {targeted[matches[0]['id']]}"
+            else:
+                row.event = matches[0]
+                targeted[row.event['id']] = row.line_no
+
+        errors = [row for row in rows if row.error]
+        if errors:
+            lines = [f"❌ {row.label()} → {row.error}" for row in errors]
+            for chunk in chunk_lines(lines, header=f"⚠️ ยังไม่ได้นำเข้า พบข้อผิดพลาด {len(errors)}/{len(rows)} แถว แก้แล้วส่งใหม่:"):
+                await ctx.send(chunk)
+            return
 
-                await ctx.send(f"♻️ แก้ไขกิจกรรม {title} เรียบร้อย! → {new_date.strftime('%d/%m/%Y')} {new_time.strftime('%H:%M')} น.")
-                return
+        await submit(calendar_client, feed.calendar_id, rows)
 
-        await ctx.send("⚠️ ไม่พบกิจกรรมที่ต้องการแก้ไข (ชื่อหรือเวลาอาจไม่ตรง)")
+        lines = []
+        for row in rows:
+            if row.error:
+                lines.append(f"❌ {row.label()} → {row.error}")
+                continue
+            if row.action == "del":
+                feed.store.discard(row.event['id'])
+            else:
+                feed.store.put(row.result)
+            lines.append(f"✅ {row.label()}")
+
+        ok = sum(1 for row in rows if not row.error)
+        for chunk in chunk_lines(lines, header=f"📥 นำเข้าสำเร็จ {ok}/{len(rows)} รายการ"):
+            await ctx.send(chunk)
     except Exception as e:
-        await ctx.send("❌ เกิดข้อผิดพลาดในการแก้ไขกิจกรรม")
-        print(f"[ERROR-แก้ไข] {e}")
+        await ctx.send("❌ เกิดข้อผิดพลาดในการนำเข้ากิจกรรม")
+        print(f"[ERROR-นำเข้า] {e}")
 
 @bot.command(name="seetask")
 async def this_month_schedule(ctx):
     try:
-        # ดึงเดือนและปีปัจจุบัน (เวลาไทย)
-        now = datetime.now(timezone(timedelta(hours=7)))
+        # ดึงเดือนและปีปัจจุบัน (ตามเขตเวลาของเซิร์ฟเวอร์)
+        tz = guild_configs.get(ctx.guild.id).tz
+        now = datetime.now(tz)
         month_str = now.strftime("%m/%Y")
 
         # ใช้ฟังก์ชันภายในเพื่อดึงตาราง
-        response = await show_month_events_internal(month_str)
+        response = await show_month_events_internal(guild_feed(ctx.guild), month_str, tz=tz)
         if response:
             await ctx.send(response)
 
         # ลบข้อความของผู้ใช้ (คำสั่ง)
-        await asyncio.sleep(60) #900
-        await ctx.message.delete()
+        delete_later(ctx.message, 60) #900
 
     except Exception as e:
         await ctx.send("❌ เกิดข้อผิดพลาดในการแสดงตารางเดือนนี้")
@@ -522,20 +869,16 @@ async def this_month_schedule(ctx):
 
 @bot.command(name="add")
 async def add_channel(ctx):
-    channel_id = ctx.channel.id
-    if channel_id not in channel_ids:
-        channel_ids.append(channel_id)
-        save_channels(channel_ids)
+    if guild_configs.add_channel(ctx.guild.id, ctx.channel.id):
+        schedule_board.mark_dirty()
         await ctx.send(f"✅ เพิ่มช่องนี้ในรายการส่งข้อความอัตโนมัติแล้ว")
     else:
         await ctx.send("⚠️ ช่องนี้มีอยู่แล้วในรายการ")
 
 @bot.command(name="remove")
 async def remove_channel(ctx):
-    channel_id = ctx.channel.id
-    if channel_id in channel_ids:
-        channel_ids.remove(channel_id)
-        save_channels(channel_ids)
+    if guild_configs.remove_channel(ctx.guild.id, ctx.channel.id):
+        await schedule_board.forget(ctx.channel)
         await ctx.send("🗑️ ลบช่องนี้ออกจากรายการสำเร็จแล้ว")
     else:
         await ctx.send("⚠️ ช่องนี้ยังไม่ถูกเพิ่มไว้")
@@ -544,63 +887,194 @@ async def remove_channel(ctx):
 async def set_voice_channel(ctx):
     print("⚙️ setvoice เริ่มทำงานแล้ว")
     if ctx.author.voice and ctx.author.voice.channel:
-        voice_channel_id = ctx.author.voice.channel.id
-        guild_id = str(ctx.guild.id)
-
-        settings = load_voice_id()
-        settings[guild_id] = voice_channel_id
-        save_voice_id(settings)
+        guild_configs.update(ctx.guild.id, voice_channel_id=ctx.author.voice.channel.id)
 
         bot_msg = await ctx.send(f"✅ ตั้งค่าห้องพูดคุยสำเร็จ: {ctx.author.voice.channel.name}")
     else:
         bot_msg = await ctx.send("⚠️ กรุณาเข้าห้องพูดคุยก่อนพิมพ์คำสั่งนี้")
 
-    await asyncio.sleep(15)
+    delete_later(bot_msg, 15)
+    delete_later(ctx.message, 20)
+
+
+async def config_command_error(ctx, error):
+    # ตั้งค่ากิลด์ได้เฉพาะคนที่มีสิทธิ์ Manage Server
+    if isinstance(error, (commands.MissingPermissions, commands.NoPrivateMessage)):
+        await ctx.send("⛔ คำสั่งนี้ใช้ได้เฉพาะผู้ที่มีสิทธิ์ Manage Server ในเซิร์ฟเวอร์")
+        return
+    log.error("[%s] %s", ctx.command, error)
+
+@bot.command(name="setcalendar")
+@commands.has_guild_permissions(manage_guild=True)
+async def set_calendar(ctx, calendar_id: str):
     try:
-        await bot_msg.delete()
-        await asyncio.sleep(5)
-        await ctx.message.delete()
-    except:
-        pass
+        # ลองอ่านก่อน ถ้า service account ไม่มีสิทธิ์จะได้บอกทันที
+        await calendar_client.execute(calendar_client.events().list(
+            calendarId=calendar_id, maxResults=1, fields="items(id)"))
+    except Exception as e:
+        await ctx.send("❌ เปิดปฏิทินนี้ไม่ได้ กรุณาแชร์ปฏิทินให้ service account ของบอทก่อน")
+        print(f"[ERROR-setcalendar] {e}")
+        return
+
+    guild_configs.update(ctx.guild.id, calendar_id=calendar_id)
+    feed = feed_for(calendar_id)
+    retire_unused_feeds()
+    await sync_feed(feed)
+    schedule_board.mark_dirty()
+    await ctx.send(f"✅ ตั้งปฏิทินของเซิร์ฟเวอร์นี้เป็น `{calendar_id}` แล้ว")
+
+@bot.command(name="setrole")
+@commands.has_guild_permissions(manage_guild=True)
+async def set_role(ctx, role: discord.Role):
+    guild_configs.update(ctx.guild.id, role_id=role.id)
+    presence.seed_roles(ctx.guild)
+    await ctx.send(f"✅ ตั้ง role ที่แจ้งเตือนและเช็คชื่อเป็น {role.name} แล้ว")
+
+@bot.command(name="settimezone")
+@commands.has_guild_permissions(manage_guild=True)
+async def set_timezone(ctx, name: str):
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await ctx.send("❌ ไม่รู้จักเขตเวลานี้ กรุณาใช้ชื่อแบบ IANA เช่น `Asia/Bangkok`")
+        return
+    guild_configs.update(ctx.guild.id, timezone=name)
+    await ctx.send(f"✅ ตั้งเขตเวลาเป็น `{name}` แล้ว")
+
+@bot.command(name="setreminders")
+@commands.has_guild_permissions(manage_guild=True)
+async def set_reminders(ctx, *, kinds: str = "default"):
+    if kinds.strip().lower() == "default":
+        reminders = None
+    else:
+        try:
+            reminders = list(parse_reminders(kinds))
+        except ValueError:
+            await ctx.send("❌ รูปแบบไม่ถูกต้อง ตัวอย่าง `!setreminders 1d today 1h 30m start` หรือ `default` / `none`")
+            return
+    config = guild_configs.update(ctx.guild.id, reminders=reminders)
+    guild_feed(ctx.guild).reminders.reschedule()
+    shown = " ".join(config.reminder_kinds) or "ไม่เตือน"
+    await ctx.send(f"✅ ตั้งการเตือนของเซิร์ฟเวอร์นี้เป็น `{shown}` แล้ว "
+                   "(กิจกรรมที่ใส่ `reminders: ...` ไว้ในคำอธิบายจะใช้ของกิจกรรมเอง)")
+
+@bot.command(name="durationreport")
+@commands.has_guild_permissions(manage_guild=True)
+async def duration_report(ctx, mode: str = "on"):
+    enabled = mode.lower() not in ("off", "stop", "no")
+    guild_configs.update(ctx.guild.id, duration_report=enabled)
+    if enabled:
+        await ctx.send("⏱️ จะโพสต์สรุปเวลาที่อยู่ในห้องเมื่อกิจกรรมจบ (`!durationreport off` เพื่อปิด)")
+    else:
+        await ctx.send("⏱️ ปิดการโพสต์สรุปเวลาที่อยู่ในห้องแล้ว (ยังเก็บลงประวัติเหมือนเดิม)")
+
+for _command in (set_calendar, set_role, set_timezone, set_reminders, duration_report):
+    _command.error(config_command_error)
+
+@bot.command(name="remindme")
+async def remind_me(ctx, mode: str = "on"):
+    if mode.lower() in ("off", "stop"):
+        if guild_configs.unsubscribe_dm(ctx.guild.id, ctx.author.id):
+            await ctx.send(f"🔕 {ctx.author.display_name} เลิกรับการเตือนทาง DM แล้ว")
+        else:
+            await ctx.send("ℹ️ ยังไม่ได้สมัครรับการเตือนทาง DM")
+        return
+    if guild_configs.subscribe_dm(ctx.guild.id, ctx.author.id):
+        await ctx.send(f"🔔 {ctx.author.display_name} จะได้รับการเตือนทาง DM ด้วย (`!remindme off` เพื่อยกเลิก)")
+    else:
+        await ctx.send("ℹ️ สมัครรับการเตือนทาง DM ไว้แล้ว")
 
 
 @bot.command(name="check")    
 async def test_checkin(ctx):
-    settings = load_voice_id()
-    voice_channel_id = settings.get(str(ctx.guild.id), 0)
+    voice_channel_id = guild_configs.get(ctx.guild.id).voice_channel_id or 0
 
     loading_msg = await ctx.send("📋 กำลังเช็คชื่อ...")
     await asyncio.sleep(2)
     await loading_msg.delete()
 
     # รอรับข้อความจากฟังก์ชันเช็คชื่อ
-    check_msg = await checkin_members(
+    check_msgs = await checkin_members(
         "ทดสอบเช็คชื่อ",
-        datetime.now().strftime("%d/%m/%Y"),
+        datetime.now(guild_configs.get(ctx.guild.id).tz).strftime("%d/%m/%Y"),
         voice_channel_id,
         ctx.channel
     )
 
-    await asyncio.sleep(10)
-    try:
-        await ctx.message.delete()
-        await asyncio.sleep(5)
-        await check_msg.delete()
-    except:
-        pass
+    delete_later(ctx.message, 10)
+    for check_msg in check_msgs:
+        delete_later(check_msg, 15)
+
 
 
 
+@bot.command(name="stats")
+async def show_stats(ctx):
+    lines = []
+    for name in timings.names():
+        stats = timings.summary(name)
+        lines.append(f"- `{name}` n={stats['count']} p50={stats['p50'] * 1000:.1f}ms "
+                     f"p99={stats['p99'] * 1000:.1f}ms max={stats['max'] * 1000:.1f}ms")
+    lines.append(f"- ปฏิทิน {len(feeds)} | กิจกรรมในหน่วยความจำ {sum(len(f.store.events) for f in feeds.values())} "
+                 f"| แจ้งเตือนที่รอ {sum(len(f.reminders) for f in feeds.values())} | คิวลบข้อความ {len(deletion_queue)}")
+    for chunk in chunk_lines(lines, header="📈 สถิติการทำงานล่าสุด:"):
+        sent = await ctx.send(chunk)
+        delete_later(sent, 60)
+    delete_later(ctx.message, 60)
+
+@bot.command(name="attendance")
+async def attendance_rates(ctx, weeks: int = 4):
+    try:
+        since = datetime.now(timezone.utc) - timedelta(weeks=weeks)
+        rows = await asyncio.to_thread(attendance_store.attendance_rates, ctx.guild.id, since)
+        if not rows:
+            await ctx.send(f"📊 ยังไม่มีประวัติเช็คชื่อใน {weeks} สัปดาห์ที่ผ่านมา")
+            return
+        lines = [f"- {name} {attended}/{total} ({attended / total:.0%})" for name, attended, total in rows]
+        await send_paged(ctx.channel, lines, f"📊 อัตราการเข้าร่วม {weeks} สัปดาห์ล่าสุด:")
+    except Exception as e:
+        await ctx.send("❌ เกิดข้อผิดพลาดในการดึงสถิติการเข้าร่วม")
+        print(f"[ERROR-attendance] {e}")
+
+@bot.command(name="missed")
+async def missed_events(ctx, *, args: str = ""):
+    # !missed [จำนวน] [ชื่อกิจกรรม] คำแรกเป็นจำนวนก็ต่อเมื่อเป็นตัวเลข เช่น !missed Scrim
+    first, _, rest = args.strip().partition(" ")
+    if first.isdigit():
+        count, title = int(first), rest.strip() or None
+    else:
+        count, title = 3, args.strip() or None
+    try:
+        names, found = await asyncio.to_thread(attendance_store.missed_last, ctx.guild.id, count, title)
+        label = f"`{title}` " if title else ""
+        if not found:
+            await ctx.send(f"📊 ยังไม่มีประวัติเช็คชื่อกิจกรรม {label}".strip())
+        elif not names:
+            await ctx.send(f"🎉 ทุกคนเข้าร่วมอย่างน้อย 1 ครั้งใน {label}{found} ครั้งล่าสุด")
+        else:
+            await send_paged(ctx.channel, [f"- {name}" for name in names], f"🚨 ขาดทุกครั้งใน {label}{found} ครั้งล่าสุด:")
+    except Exception as e:
+        await ctx.send("❌ เกิดข้อผิดพลาดในการดึงรายชื่อคนที่ขาด")
+        print(f"[ERROR-missed] {e}")
+
 
-from keep_alive import keep_alive
 
-keep_alive()  # ✅ เรียกก่อน เพื่อให้ web server ทำงานก่อนบอท
 
 async def main():
-    async with bot:
-        await asyncio.sleep(10)
-        await bot.start(TOKEN)
+    # web server อยู่บน event loop เดียวกับบอท ไม่ต้องแยก thread Flask แล้ว
+    log.info("[startup] modules loaded t+%.0fms", (time.perf_counter() - PROCESS_STARTED) * 1000)
+    with startup_phase("web_server"):
+        runner = await create_web_server()
+    try:
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        await runner.cleanup()
+        await drain_tasks()
+        persist_state()
 
 if __name__ == "__main__":
     asyncio.run(main())
+    if restart_requested:
+        os.execv(sys.executable, [sys.executable] + sys.argv)
 
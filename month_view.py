@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from rendering import DEFAULT_TZ, event_times
+
+MONTH_NAMES_TH = [
+    "มกราคม", "กุมภาพันธ์", "มีนาคม", "เมษายน", "พฤษภาคม", "มิถุนายน",
+    "กรกฎาคม", "สิงหาคม", "กันยายน", "ตุลาคม", "พฤศจิกายน", "ธันวาคม"
+]
+
+
+# เขตเวลาห่างจาก UTC ไม่เกินนี้ ใช้ขยายช่วงเดือนตอนล้าง cache ให้ครอบคลุมทุกเขตเวลา
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+
+def month_bounds(year, month, tz=DEFAULT_TZ):
+    start = datetime(year, month, 1, tzinfo=tz)
+    end = datetime(year + int(month == 12), (month % 12) + 1, 1, tzinfo=tz)
+    return start, end
+
+
+def render_month(events, year, month, tz=DEFAULT_TZ):
+    month_thai = MONTH_NAMES_TH[month - 1]
+    if not events:
+        return f"🫰🏽 ไม่มีทั้งแข่งทั้งซ้อมในเดือน {month_thai} {year}"
+
+    lines = [f"**📅 ตารางซ้อม/แข่งเดือน {month_thai} {year} :**"]
+    for event in events:
+        title = event.get('summary', 'ไม่ระบุชื่อกิจกรรม')
+        local = event_times(event).local(tz)
+        lines.append(f"- {title} → {local.date} | {local.time_24} น. | {local.time_12}")
+    return "\n".join(lines) + "\n"
+
+
+def event_months(event):
+    """Every (year, month) the event touches in any time zone."""
+    times = event_times(event)
+    start = (times.start - MAX_UTC_OFFSET).astimezone(timezone.utc)
+    end = (times.end + MAX_UTC_OFFSET).astimezone(timezone.utc)
+    year, month = start.year, start.month
+    months = []
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = year + int(month == 12), (month % 12) + 1
+    return months
+
+
+class MonthViewCache:
+    """Rendered month schedules keyed by (year, month, time zone), with TTL and LRU eviction."""
+
+    def __init__(self, max_entries=24, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, year, month, tz=DEFAULT_TZ):
+        key = (year, month, str(tz))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, text = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, year, month, text, tz=DEFAULT_TZ):
+        key = (year, month, str(tz))
+        self._entries[key] = (time.monotonic() + self.ttl, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, year, month):
+        """Drop the month in every time zone it was rendered for."""
+        for key in [key for key in self._entries if key[:2] == (year, month)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def on_event_changed(self, event_id, old, new):
+        """EventStore listener: drop only the months the old and new versions touch."""
+        for event in (old, new):
+            if event is not None:
+                for year, month in event_months(event):
+                    self.invalidate(year, month)
@@ -0,0 +1,126 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from dispatcher import chunk_lines
+
+
+def checkin_messages(title, date_str, role_members, present):
+    """The check-in post for ``role_members`` (``{id: name}``), split to fit Discord's limit."""
+    lines = [f"- {name} {'✅' if member_id in present else '❌'}"
+             for member_id, name in sorted(role_members.items(), key=lambda item: item[1].casefold())]
+    if not lines:
+        lines = ["ไม่มีใครอยู่ในห้อง"]
+    return chunk_lines(lines, header=f"📝 `{title}` {date_str} เช็คชื่อ ({len(present)}/{len(role_members)}):")
+
+
+class PresenceTracker:
+    """Per-guild role members and voice occupants, fed by gateway events.
+
+    Check-in becomes a set operation instead of scanning ``guild.members``.
+    Join/leave times are kept for ``retention`` so attendance duration for
+    a time window (one event) can be computed after the fact.
+    ``role_for(guild_id)`` returns the role tracked in that guild.
+    """
+
+    def __init__(self, role_for, retention=timedelta(hours=12)):
+        self.role_for = role_for
+        self.retention = retention
+        self._role_members = {}
+        self._voice = {}
+        self._history = {}
+
+    def _guild_voice(self, guild_id):
+        return self._voice.setdefault(guild_id, {})
+
+    def seed_roles(self, guild):
+        """Re-read who holds the tracked role, e.g. after the role changed."""
+        role = guild.get_role(self.role_for(guild.id))
+        self._role_members[guild.id] = {m.id: m.display_name for m in role.members} if role else {}
+
+    def seed(self, guild, now=None):
+        """Take a snapshot of one guild (on ready / guild join).
+
+        on_ready fires again after every new gateway session, so members still
+        in the same channel keep their join time; sessions that ended while
+        we were not listening are closed into the history at ``now``.
+        """
+        now = now or datetime.now(timezone.utc)
+        self.seed_roles(guild)
+
+        previous = self._voice.get(guild.id, {})
+        voice = {}
+        for channel in guild.voice_channels + guild.stage_channels:
+            for member in channel.members:
+                # เวลาเข้าห้องจริงไม่รู้ ใช้เวลาที่เริ่มติดตามแทน
+                voice.setdefault(channel.id, {})[member.id] = previous.get(channel.id, {}).get(member.id, now)
+        for channel_id, members in list(previous.items()):
+            for member_id in list(members):
+                if member_id not in voice.get(channel_id, {}):
+                    self._leave(guild.id, channel_id, member_id, now)
+        self._voice[guild.id] = voice
+
+    def forget(self, guild_id):
+        self._role_members.pop(guild_id, None)
+        self._voice.pop(guild_id, None)
+        self._history.pop(guild_id, None)
+
+    def _leave(self, guild_id, channel_id, member_id, now):
+        channel = self._guild_voice(guild_id).get(channel_id)
+        if not channel or member_id not in channel:
+            return
+        joined = channel.pop(member_id)
+        if not channel:
+            del self._guild_voice(guild_id)[channel_id]
+        history = self._history.setdefault(guild_id, deque())
+        history.append((member_id, channel_id, joined, now))
+        while history and history[0][3] < now - self.retention:
+            history.popleft()
+
+    def on_voice_state_update(self, member, before, after, now=None):
+        if before.channel == after.channel:
+            return
+        now = now or datetime.now(timezone.utc)
+        guild_id = member.guild.id
+        if before.channel is not None:
+            self._leave(guild_id, before.channel.id, member.id, now)
+        if after.channel is not None:
+            self._guild_voice(guild_id).setdefault(after.channel.id, {})[member.id] = now
+
+    def on_member_update(self, before, after):
+        members = self._role_members.setdefault(after.guild.id, {})
+        role_id = self.role_for(after.guild.id)
+        if any(role.id == role_id for role in after.roles):
+            members[after.id] = after.display_name
+        else:
+            members.pop(after.id, None)
+
+    def on_member_remove(self, member):
+        self._role_members.get(member.guild.id, {}).pop(member.id, None)
+
+    def role_members(self, guild_id):
+        """``{member_id: display_name}`` of everyone holding the tracked role."""
+        return self._role_members.get(guild_id, {})
+
+    def voice_members(self, guild_id, channel_id):
+        return set(self._voice.get(guild_id, {}).get(channel_id, {}))
+
+    def roll_call(self, guild_id, voice_channel_id):
+        """``(role_members, present)``: everyone holding the role and who of them is in the channel."""
+        role_members = self.role_members(guild_id)
+        return role_members, role_members.keys() & self.voice_members(guild_id, voice_channel_id)
+
+    def attendance(self, guild_id, channel_id, start, end, now=None):
+        """Seconds each member spent in ``channel_id`` between ``start`` and ``end``."""
+        now = now or datetime.now(timezone.utc)
+        end = min(end, now)
+        totals = {}
+        sessions = list(self._history.get(guild_id, ()))
+        sessions += [(m, channel_id, joined, now)
+                     for m, joined in self._voice.get(guild_id, {}).get(channel_id, {}).items()]
+        for member_id, session_channel, joined, left in sessions:
+            if session_channel != channel_id:
+                continue
+            overlap = (min(left, end) - max(joined, start)).total_seconds()
+            if overlap > 0:
+                totals[member_id] = totals.get(member_id, 0) + overlap
+        return totals
@@ -0,0 +1,61 @@
+from datetime import date, datetime, time, timezone
+
+from dateutil.parser import isoparse
+from dateutil.rrule import rrulestr
+
+from instrumentation import log
+from rendering import zone
+
+
+def instance_id(master_id, original_start):
+    """The id Google gives an instance: ``<master>_<YYYYMMDD>`` or ``<master>_<YYYYMMDDTHHMMSSZ>``."""
+    if 'date' in original_start:
+        return f"{master_id}_{original_start['date'].replace('-', '')}"
+    start = isoparse(original_start['dateTime']).astimezone(timezone.utc)
+    return f"{master_id}_{start.strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def expand(master, start, end, tz):
+    """Instances of a recurring ``master`` that overlap ``[start, end)``.
+
+    RRULE/RDATE/EXDATE/EXRULE lines come straight from ``master['recurrence']``.
+    Timed series recur in the master's own time zone so they keep their wall
+    clock time across DST. All-day series recur on dates, with the calendar's
+    ``tz`` only used to turn the window into dates. Modified or cancelled
+    instances are applied by the caller.
+    """
+    first, last = master['start'], master.get('end') or master['start']
+    all_day = 'date' in first
+    if all_day:
+        dtstart = datetime.combine(date.fromisoformat(first['date']), time())
+        length = date.fromisoformat(last['date']) - date.fromisoformat(first['date'])
+        lo = start.astimezone(tz).replace(tzinfo=None) - length
+        hi = end.astimezone(tz).replace(tzinfo=None)
+    else:
+        series_tz = zone(first.get('timeZone'), tz)
+        dtstart = isoparse(first['dateTime']).astimezone(series_tz)
+        length = isoparse(last['dateTime']) - isoparse(first['dateTime'])
+        lo, hi = start - length, end
+
+    try:
+        rules = rrulestr("\n".join(master.get('recurrence', ())), dtstart=dtstart, forceset=True)
+        occurrences = rules.between(lo, hi, inc=True)
+    except (ValueError, TypeError) as e:
+        # กฎที่ dateutil อ่านไม่ได้ แสดงแค่ครั้งแรกดีกว่าทำให้ทั้งปฏิทินซิงก์ไม่ได้
+        log.warning("[recurrence] %s: %s", master.get('id'), e)
+        occurrences = [dtstart] if lo <= dtstart < hi else []
+
+    base = {k: v for k, v in master.items() if k != 'recurrence' and not k.startswith('_')}
+    instances = []
+    for occurrence in occurrences:
+        if all_day:
+            when = {'date': occurrence.date().isoformat()}
+            until = {'date': (occurrence.date() + length).isoformat()}
+        else:
+            when = {'dateTime': occurrence.isoformat()}
+            until = {'dateTime': (occurrence + length).isoformat()}
+            if first.get('timeZone'):
+                when['timeZone'] = until['timeZone'] = first['timeZone']
+        instances.append(dict(base, id=instance_id(master['id'], when), recurringEventId=master['id'],
+                              originalStartTime=when, start=when, end=until))
+    return instances
@@ -0,0 +1,242 @@
+import asyncio
+import heapq
+import html
+import itertools
+import re
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from instrumentation import log, timings
+from rendering import event_times
+
+# ชนิดการเตือน: "today", "start" หรือระยะก่อนเริ่มแบบ 30m / 2h / 1d
+DEFAULT_REMINDERS = ("1d", "today", "1h", "10m", "start")
+# ป้ายในคำอธิบายกิจกรรมใส่ได้ไม่เกินนี้ กันใส่มาเป็นสิบ ๆ อันแล้วสแปมทั้งทีม
+MAX_REMINDERS = 8
+# เลยกำหนดไปได้นานเท่าไหร่ถึงยังส่ง
+TIMED_GRACE = timedelta(minutes=1)
+SHORT_GRACE = {"10m": timedelta(seconds=30)}
+ALL_DAY_GRACE = timedelta(hours=1)
+# สรุปเวลาที่แต่ละคนอยู่ในห้องตอนกิจกรรมจบ
+CHECKOUT_GRACE = timedelta(minutes=5)
+# reminders + checkin + checkout
+ENTRIES_PER_EVENT = MAX_REMINDERS + 2
+
+UNITS = {"d": timedelta(days=1), "h": timedelta(hours=1), "m": timedelta(minutes=1)}
+OFFSET_RE = re.compile(r"(\d{1,3})([dhm])")
+# บรรทัดแบบ "reminders: 1d 1h 30m" หรือ "mention: off" ในคำอธิบายกิจกรรม
+TAG_RE = re.compile(r"^[ \t]*#?(reminders?|mention|ping)[ \t]*[:=][ \t]*(.*?)[ \t]*$", re.I | re.M)
+
+
+class ReminderPolicy(NamedTuple):
+    kinds: tuple = None     # None = ใช้ค่าของกิลด์/ปฏิทิน
+    mention: bool = True
+
+
+def reminder_offset(kind):
+    """How long before the start ``kind`` fires, or None for "today" and unknown kinds."""
+    if kind == "start":
+        return timedelta(0)
+    match = OFFSET_RE.fullmatch(kind)
+    return int(match.group(1)) * UNITS[match.group(2)] if match else None
+
+
+def _canonical(offset):
+    # 60m กับ 1h เป็นการเตือนเดียวกัน
+    for unit in ("d", "h", "m"):
+        if offset % UNITS[unit] == timedelta(0):
+            return f"{offset // UNITS[unit]}{unit}"
+
+
+def parse_reminders(text):
+    """``"1d 1h 30m start"`` → kinds in that order; ``none``/``off`` → ``()``.
+
+    Raises ValueError for anything that is not a reminder kind.
+    """
+    words = [word for word in re.split(r"[\s,]+", text.strip().lower()) if word]
+    if words in (["none"], ["off"]):
+        return ()
+    kinds = []
+    for word in words:
+        offset = reminder_offset(word)
+        if word != "today" and offset is None:
+            raise ValueError(f"unknown reminder {word!r}")
+        kind = "today" if word == "today" else _canonical(offset) if offset else "start"
+        if kind not in kinds:
+            kinds.append(kind)
+    if not kinds or len(kinds) > MAX_REMINDERS:
+        raise ValueError(f"expected 1-{MAX_REMINDERS} reminders")
+    return tuple(kinds)
+
+
+def _description_text(description):
+    # คำอธิบายที่แก้ผ่านเว็บ Google Calendar มักเป็น HTML
+    text = re.sub(r"<br\s*/?>|</p>|</div>", "\n", description, flags=re.I)
+    return html.unescape(re.sub(r"<[^>]+>", "", text))
+
+
+def event_policy(event):
+    """The reminder tags in an event's description, parsed once and kept on the event."""
+    policy = event.get('_policy')
+    if policy is None:
+        kinds, mention = None, True
+        for name, value in TAG_RE.findall(_description_text(event.get('description') or "")):
+            name = name.lower()
+            try:
+                if name.startswith("reminder"):
+                    kinds = parse_reminders(value)
+                else:
+                    mention = value.lower() not in ("off", "none", "no", "false")
+            except ValueError as e:
+                log.warning("[reminder] %s: ป้าย %s ใช้ไม่ได้ (%s)", event.get('id'), name, e)
+        policy = event['_policy'] = ReminderPolicy(kinds, mention)
+    return policy
+
+
+def reminder_times(event, kinds=DEFAULT_REMINDERS):
+    """Return ``(kind, fire_at, deadline)`` for ``kinds`` plus check-in/checkout of an event."""
+    parsed = event_times(event)
+    start, end = parsed.start, parsed.end
+    times = []
+    for kind in kinds:
+        if kind == "today":
+            # ยิงตอนเที่ยงคืน (เขตเวลาของปฏิทิน) ของวันกิจกรรม และยังส่งได้ทั้งวันจนกว่ากิจกรรมจะจบ
+            midnight = parsed.day_start()
+            times.append(("today", midnight, min(midnight + timedelta(days=1), end)))
+            continue
+        before = reminder_offset(kind)
+        if before is None:
+            continue
+        if parsed.all_day:
+            # กิจกรรมทั้งวันเตือนได้แค่ล่วงหน้าเป็นวัน
+            if not before or before % UNITS["d"]:
+                continue
+            grace = ALL_DAY_GRACE
+        else:
+            grace = SHORT_GRACE.get(kind, TIMED_GRACE)
+        times.append((kind, start - before, start - before + grace))
+    if not parsed.all_day:
+        times.append(("checkin", start, start + TIMED_GRACE))
+        times.append(("checkout", end, end + CHECKOUT_GRACE))
+    return times
+
+
+class WallClock:
+    """Real time for ReminderScheduler; the benchmarks swap in a simulated clock."""
+
+    def now(self):
+        return datetime.now(timezone.utc)
+
+    async def wait(self, event, timeout):
+        """Wait until ``event`` is set or ``timeout`` seconds pass (None = no timeout)."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ReminderScheduler:
+    """Fires reminders at their exact deadlines from a heap instead of polling.
+
+    Entries are invalidated lazily: rescheduling an event bumps its version
+    and stale heap entries are skipped when they surface. ``kinds(event)``
+    picks the reminders of each event (default: DEFAULT_REMINDERS).
+    """
+
+    def __init__(self, fire, kinds=None, clock=None):
+        self._fire = fire
+        self._kinds = kinds or (lambda event: DEFAULT_REMINDERS)
+        self.clock = clock or WallClock()
+        self._heap = []
+        self._events = {}
+        self._versions = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running = set()
+
+    def __len__(self):
+        return len(self._versions)
+
+    def heap_size(self):
+        return len(self._heap)
+
+    def schedule(self, event, now=None):
+        now = now or self.clock.now()
+        event_id = event['id']
+        version = next(self._counter)
+        self._events[event_id] = event
+        self._versions[event_id] = version
+        for kind, fire_at, deadline in reminder_times(event, self._kinds(event)):
+            if deadline > now:
+                heapq.heappush(self._heap, (fire_at, version, event_id, kind, deadline))
+        self.compact()
+        self._wakeup.set()
+
+    def reschedule(self):
+        """Recompute every event, e.g. after the default reminders changed."""
+        for event in list(self._events.values()):
+            self.schedule(event)
+
+    def unschedule(self, event_id):
+        self._events.pop(event_id, None)
+        if self._versions.pop(event_id, None) is not None:
+            self._wakeup.set()
+
+    def on_event_changed(self, event_id, old, new):
+        """EventStore listener: recompute only the entries of the event that changed."""
+        if new is None:
+            self.unschedule(event_id)
+        else:
+            self.schedule(new)
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        while self._heap and self._versions.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def compact(self, force=False):
+        # กันไม่ให้ heap โตเพราะ entry เก่าที่ถูกแทนที่แล้ว เกณฑ์ต้องเกินจำนวน entry ต่อกิจกรรม
+        # ไม่อย่างนั้นจะ compact ทุกครั้งที่ schedule (O(n²) ตอนซิงก์ครั้งแรก)
+        if force or len(self._heap) > 2 * ENTRIES_PER_EVENT * len(self._versions) + 64:
+            self._heap = [entry for entry in self._heap if self._versions.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def pop_due(self, now):
+        """Remove and return ``(event, kind, fire_at)`` for every entry due at ``now``."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, version, event_id, kind, deadline = heapq.heappop(self._heap)
+            if self._versions.get(event_id) != version:
+                continue
+            if now > deadline:
+                log.warning("[reminder] ข้าม %s|%s เพราะเลยเวลามาแล้ว", event_id, kind)
+                continue
+            due.append((self._events[event_id], kind, fire_at))
+        return due
+
+    async def _fire_safely(self, event, kind, fire_at):
+        try:
+            await self._fire(event, kind, fire_at)
+        except Exception as e:
+            log.exception("[reminder] %s|%s: %s", event['id'], kind, e)
+
+    async def run(self):
+        while True:
+            with timings.span("loop.evaluate") as span:
+                due = self.pop_due(self.clock.now())
+                span["due"] = len(due)
+            for event, kind, fire_at in due:
+                # ส่งแบบไม่รอ เพื่อไม่ให้ข้อความที่ส่งช้าทำให้ deadline ถัดไปเลื่อน
+                task = asyncio.create_task(self._fire_safely(event, kind, fire_at))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            timeout = None
+            if deadline is not None:
+                timeout = max((deadline - self.clock.now()).total_seconds(), 0)
+            await self.clock.wait(self._wakeup, timeout)
@@ -0,0 +1,73 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.parser import isoparse
+
+DEFAULT_TIMEZONE = "Asia/Bangkok"
+try:
+    DEFAULT_TZ = ZoneInfo(DEFAULT_TIMEZONE)
+except ZoneInfoNotFoundError:
+    # เครื่องที่ไม่มีฐานข้อมูลเขตเวลา (Windows, container แบบ slim) ใช้ UTC+7 คงที่แบบเดิม
+    DEFAULT_TZ = timezone(timedelta(hours=7))
+
+# เก็บผลไว้ใน dict ของ event เอง event ใหม่จากการซิงก์เป็น dict ใหม่ cache จึงหมดอายุไปเอง
+_CACHE_KEY = "_times"
+
+
+def zone(name, fallback=DEFAULT_TZ):
+    """``ZoneInfo(name)``, or ``fallback`` for a missing/unknown name."""
+    try:
+        return ZoneInfo(name) if name else fallback
+    except (ZoneInfoNotFoundError, ValueError):
+        return fallback
+
+
+class LocalTimes(NamedTuple):
+    dt: datetime
+    date: str
+    time_24: str
+    time_12: str
+
+
+class EventTimes:
+    """An event's start/end parsed once, plus formatted strings per display time zone.
+
+    All-day events start at local midnight in ``tz`` (the calendar's own
+    time zone), not at UTC midnight.
+    """
+
+    __slots__ = ("start", "end", "all_day", "tz", "_local")
+
+    def __init__(self, event, tz=DEFAULT_TZ):
+        self.tz = tz
+        self.all_day = 'date' in event['start']
+        self.start = self._parse(event['start'])
+        self.end = max(self._parse(event.get('end') or event['start']), self.start)
+        self._local = {}
+
+    def _parse(self, when):
+        if 'dateTime' in when:
+            return isoparse(when['dateTime'])
+        return datetime.combine(date.fromisoformat(when['date']), time(), tzinfo=self.tz)
+
+    def local(self, tz=DEFAULT_TZ):
+        times = self._local.get(tz)
+        if times is None:
+            # กิจกรรมทั้งวันเป็นวันที่ตามปฏิทิน ไม่เลื่อนวันตามเขตเวลาของคนดู
+            dt = self.start if self.all_day else self.start.astimezone(tz)
+            times = self._local[tz] = LocalTimes(
+                dt, dt.strftime('%d/%m/%Y'), dt.strftime('%H:%M'), dt.strftime('%I:%M %p'))
+        return times
+
+    def day_start(self):
+        """Midnight, in the event's own time zone, of the day the event starts."""
+        return datetime.combine(self.start.astimezone(self.tz).date(), time(), tzinfo=self.tz)
+
+
+def event_times(event, tz=None):
+    """Cached :class:`EventTimes`; passing ``tz`` (re)builds it for that calendar zone."""
+    times = event.get(_CACHE_KEY)
+    if times is None or (tz is not None and times.tz is not tz):
+        times = event[_CACHE_KEY] = EventTimes(event, tz or DEFAULT_TZ)
+    return times
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+
+import discord
+
+from instrumentation import log
+from state_store import atomic_write_text
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ScheduleBoard:
+    """One pinned schedule message per channel, edited in place.
+
+    The message id, month and content digest per channel are persisted, so
+    a refresh is a no-op when nothing changed and never has to scan channel
+    history. At the month boundary the same message is edited to show the
+    new month.
+    """
+
+    def __init__(self, path, dispatcher, interval=60):
+        self.path = Path(path)
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self._state = {}
+        self._wakeup = asyncio.Event()
+        if self.path.exists():
+            try:
+                self._state = json.loads(self.path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                log.warning("[board] %s เสียหาย จะโพสต์ตารางใหม่", self.path)
+
+    def tracked(self, channel_id):
+        return str(channel_id) in self._state
+
+    async def forget(self, channel):
+        """Stop tracking ``channel`` and delete its schedule message (which also unpins it)."""
+        entry = self._state.pop(str(channel.id), None)
+        if entry is None:
+            return
+        self._save()
+        try:
+            await channel.get_partial_message(entry["message_id"]).delete()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            log.warning("[board] ลบตารางเดิมในช่อง %s ไม่ได้: %s", channel.id, e)
+
+    def mark_dirty(self):
+        self._wakeup.set()
+
+    def _save(self):
+        atomic_write_text(self.path, json.dumps(self._state))
+
+    async def _publish(self, channel, month_key, text, digest):
+        entry = self._state.get(str(channel.id))
+        if entry and entry["month"] == month_key and entry["digest"] == digest:
+            return None
+
+        if entry:
+            try:
+                message = channel.get_partial_message(entry["message_id"])
+                await message.edit(content=text)
+                self._state[str(channel.id)] = {"message_id": message.id, "month": month_key, "digest": digest}
+                return message
+            except discord.NotFound:
+                # ข้อความเดิมถูกลบไปแล้ว โพสต์ใหม่แทน
+                pass
+
+        message = await channel.send(text)
+        try:
+            await message.pin()
+        except discord.HTTPException:
+            pass
+        self._state[str(channel.id)] = {"message_id": message.id, "month": month_key, "digest": digest}
+        return message
+
+    async def refresh(self, channels, year, month, text):
+        """Bring every channel's schedule message up to date; unchanged ones cost no API call."""
+        month_key = f"{year:04d}-{month:02d}"
+        digest = _digest(text)
+        report = await self.dispatcher.fan_out(
+            channels, lambda channel: self._publish(channel, month_key, text, digest))
+        if report.sent:
+            self._save()
+            log.info("📅 อัปเดตตารางประจำเดือน %d ช่อง %s", len(report.sent), report.summary())
+        return report
+
+    async def run(self, render, groups):
+        """Refresh on every ``mark_dirty()`` and at least every ``interval`` seconds.
+
+        ``groups()`` returns ``{key: channels}`` and ``render(key)`` the
+        ``(year, month, text)`` of that group's current month, so channels that
+        would show the same schedule share one render.
+        """
+        while True:
+            self._wakeup.clear()
+            for key, channels in groups().items():
+                try:
+                    year, month, text = await render(key)
+                    await self.refresh(channels, year, month, text)
+                except Exception as e:
+                    log.exception("[board] %s: %s", key, e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
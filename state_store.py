@@ -0,0 +1,154 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from instrumentation import log
+
+
+def atomic_write_text(path, text):
+    """Write a file so readers only ever see the old or the new content."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ExpiringKeyStore:
+    """A set of keys persisted as an append-only JSON-lines log.
+
+    Every key carries an expiry time. Adding a key appends one line; the log
+    is rewritten atomically (compacted) once dead lines outnumber live keys.
+    fsync is batched: writes reach the OS immediately but are forced to disk
+    at most every ``fsync_interval`` seconds or on ``flush(force=True)``.
+    Old files holding a plain JSON list are migrated on load.
+    """
+
+    def __init__(self, path, default_ttl=timedelta(days=7), fsync_interval=5.0):
+        self.path = Path(path)
+        self.default_ttl = default_ttl
+        self.fsync_interval = fsync_interval
+        self._expires = {}
+        self._lines = 0
+        self._file = None
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self._load()
+
+    def __contains__(self, key):
+        return key in self._expires
+
+    def __len__(self):
+        return len(self._expires)
+
+    def __iter__(self):
+        return iter(self._expires)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        text = self.path.read_text(encoding="utf-8")
+        if text.lstrip().startswith("["):
+            # ไฟล์รูปแบบเก่า (JSON list) ไม่มีเวลาหมดอายุ ให้อายุตาม default_ttl แล้วเขียนใหม่
+            try:
+                keys = json.loads(text)
+            except json.JSONDecodeError:
+                keys = []
+            expires_at = time.time() + self.default_ttl.total_seconds()
+            self._expires = {key: expires_at for key in keys}
+            self.compact()
+            return
+
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # บรรทัดสุดท้ายอาจเขียนไม่ครบตอนโปรเซสตาย ข้ามไป
+                log.warning("[state] %s มีบรรทัดเสียหาย ข้ามไป", self.path)
+                continue
+            self._lines += 1
+            if record.get("d"):
+                self._expires.pop(record["k"], None)
+            else:
+                self._expires[record["k"]] = record["e"]
+        self.expire()
+        if text and not text.endswith("\n"):
+            self.compact()
+
+    def _append(self, record):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._lines += 1
+        self._unsynced = True
+        self.flush()
+
+    def add(self, key, expires_at=None):
+        """Add ``key`` until ``expires_at`` (an aware datetime); no-op if already present."""
+        if key in self._expires:
+            return
+        if expires_at is None:
+            ts = time.time() + self.default_ttl.total_seconds()
+        else:
+            ts = expires_at.timestamp()
+        self._expires[key] = ts
+        self._append({"k": key, "e": ts})
+
+    def discard(self, key):
+        if self._expires.pop(key, None) is not None:
+            self._append({"k": key, "d": 1})
+
+    def expire(self, now=None):
+        """Drop keys whose expiry has passed and compact if the log is mostly dead lines."""
+        now = (now or datetime.now(timezone.utc)).timestamp()
+        expired = [key for key, ts in self._expires.items() if ts <= now]
+        for key in expired:
+            del self._expires[key]
+        if self._lines > 2 * len(self._expires) + 100:
+            self.compact()
+        return len(expired)
+
+    def rename(self, rename):
+        """Rewrite every key as ``rename(key)``, keeping its expiry; returns how many changed.
+
+        Used to migrate keys written in an older format; the log is compacted
+        only when something actually changed.
+        """
+        renamed = {rename(key): ts for key, ts in self._expires.items()}
+        changed = sum(1 for key in renamed if key not in self._expires)
+        if changed:
+            self._expires = renamed
+            self.compact()
+        return changed
+
+    def compact(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        lines = "".join(json.dumps({"k": key, "e": ts}, ensure_ascii=False) + "\n"
+                        for key, ts in self._expires.items())
+        atomic_write_text(self.path, lines)
+        self._lines = len(self._expires)
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+
+    def flush(self, force=False):
+        if not self._unsynced or self._file is None:
+            return
+        if force or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        self.flush(force=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None